@@ -0,0 +1,57 @@
+"""Render time of one post card: the includes/post_card.html template
+against the Python renderer of FAST_POST_CARDS, and the cost of the
+URLs of a feed with reverse() and with cached_reverse()
+
+Run with YATUBE_DEBUG=0 to compare against the cached template loader:
+python -m benchmarks.bench_cards
+"""
+from benchmarks.bench_views import populate
+from benchmarks.utils import measure, report, setup
+
+
+def main(cards=10):
+    setup()
+    from django.template import engines
+    from django.test import override_settings
+    from django.urls import reverse
+    from yatube.reverse import cached_reverse
+    from posts.models import Post
+    from posts.views import load_cards
+    reader, post = populate()
+    posts = load_cards(list(Post.objects.select_related('author', 'group')
+                            .filter(author=post.author)[:cards]))
+    feed = engines['django'].from_string(
+        '{% load post_cards %}{% for post in posts %}'
+        '{% post_card post %}{% endfor %}')
+    context = {'posts': posts, 'user': post.author}
+    rows = []
+    results = []
+    for fast in (False, True):
+        with override_settings(FAST_POST_CARDS=fast):
+            results.append(feed.render(context))
+            per_card = measure(lambda: feed.render(context), 200) / cards
+        name = 'python renderer' if fast else 'post_card.html include'
+        rows.append((name, f'{per_card * 1000:.1f} us per card'))
+    rows.append(('identical markup', results[0] == results[1]))
+    report(f'Feed of {cards} cards', rows)
+
+    urls = []
+    for post in posts:
+        username = post.author.username
+        urls += [('profile', (username,)), ('post', (username, post.pk)),
+                 ('post_edit', (username, post.pk)),
+                 ('post_delete', (username, post.pk))]
+        if post.group:
+            urls.append(('group', (post.group.slug,)))
+    rows = [
+        ('reverse', measure(
+            lambda: [reverse(name, args=args) for name, args in urls])),
+        ('cached_reverse', measure(
+            lambda: [cached_reverse(name, *args) for name, args in urls])),
+    ]
+    report(f'{len(urls)} URLs of the feed, ms',
+           [(name, f'{value:.3f}') for name, value in rows])
+
+
+if __name__ == '__main__':
+    main()
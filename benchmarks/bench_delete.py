@@ -0,0 +1,90 @@
+"""Deleting a prolific user: Django's collector behind user.delete()
+against the chunked set-based delete of posts.deletion. Time, queries
+and peak of Python memory allocations of each on the same data
+
+python -m benchmarks.bench_delete [posts] [comments]
+
+The defaults are a tenth of the target of 100000 posts and 1000000
+comments, the collector needs gigabytes of memory for the full size.
+Times include the overhead of tracemalloc.
+"""
+import sys
+import time
+import tracemalloc
+
+from benchmarks.utils import report, setup
+
+CHUNK = 5000
+
+
+def populate(posts, comments):
+    """An author with the posts, comments spread over them by other
+    users, the author's follows and an image on every tenth post"""
+    from django.db import transaction
+    from posts.models import Comment, Follow, Group, Post, User
+    author = User.objects.create_user(username='prolific')
+    readers = list(User.objects.filter(username__startswith='reader'))
+    if not readers:
+        User.objects.bulk_create(User(username=f'reader{i}')
+                                 for i in range(50))
+        readers = list(User.objects.filter(username__startswith='reader'))
+    group = Group.objects.get_or_create(title='Bench', slug='bench')[0]
+    Follow.objects.bulk_create(Follow(user=reader, author=author)
+                               for reader in readers)
+    first = (Post.objects.order_by('-pk').values_list('pk', flat=True)
+             .first() or 0) + 1
+    with transaction.atomic():
+        for start in range(0, posts, CHUNK):
+            Post.objects.bulk_create(
+                Post(pk=first + i, text=f'post {i}', author=author,
+                     group=group if i % 2 else None,
+                     image=f'posts/bench{i}.png' if i % 10 == 0 else '')
+                for i in range(start, min(start + CHUNK, posts)))
+        for start in range(0, comments, CHUNK):
+            Comment.objects.bulk_create(
+                Comment(post_id=first + i % posts, text='nice',
+                        author=readers[i % len(readers)])
+                for i in range(start, min(start + CHUNK, comments)))
+    return author
+
+
+def run(func):
+    """Time in seconds, number of queries and peak memory in MB"""
+    from django.db import connection
+    queries = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with connection.execute_wrapper(count):
+        func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, queries, peak / 2 ** 20
+
+
+def main(posts=10000, comments=100000):
+    setup()
+    from jobs.models import Job
+    from posts import deletion
+    from posts.models import Comment, Post
+    rows = []
+    for name, delete in (('user.delete()', lambda user: user.delete()),
+                         ('deletion.delete_user', deletion.delete_user)):
+        author = populate(posts, comments)
+        elapsed, queries, peak = run(lambda: delete(author))
+        assert not Post.objects.exists() and not Comment.objects.exists()
+        rows.append((name, f'{elapsed:.2f} s, {queries} queries, '
+                           f'{peak:.1f} MB peak'))
+        Job.objects.all().delete()
+    report(f'Deleting a user with {posts} posts and {comments} comments',
+           rows)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,59 @@
+"""Overhead of yatube.ratelimit on the allowed path: a trivial view with
+and without rate_limited, with buckets in the cache and in the memory
+of the process, and a rejected request for comparison
+
+python -m benchmarks.bench_ratelimit
+"""
+from benchmarks.utils import measure, report, setup
+
+
+def main(repeat=20000):
+    setup()
+    from django.contrib.auth.models import AnonymousUser
+    from django.http import HttpResponse
+    from django.test import RequestFactory, override_settings
+    from posts.models import User
+    from yatube import ratelimit
+
+    def view(request):
+        return HttpResponse()
+
+    limited = ratelimit.rate_limited('bench')(view)
+    request = RequestFactory().post('/bench/')
+    request.user = User.objects.create_user(username='bench')
+    anonymous = RequestFactory().post('/bench/')
+    anonymous.user = AnonymousUser()
+    rows = []
+    unlimited = (10 ** 9, 10 ** 9)
+    with override_settings(RATE_LIMITS={'bench': {'user': unlimited,
+                                                  'ip': unlimited}}):
+        rows.append(('plain view', measure(lambda: view(request), repeat)))
+        rows.append(('limited, signed in',
+                     measure(lambda: limited(request), repeat)))
+        rows.append(('limited, anonymous',
+                     measure(lambda: limited(anonymous), repeat)))
+        get_many = ratelimit.cache.get_many
+
+        def unavailable(*args, **kwargs):
+            raise ConnectionError
+
+        ratelimit.cache.get_many = unavailable
+        ratelimit.logger.disabled = True
+        try:
+            rows.append(('limited, cache unavailable',
+                         measure(lambda: limited(request), repeat)))
+        finally:
+            ratelimit.cache.get_many = get_many
+            ratelimit.logger.disabled = False
+    exhausted = (10 ** -9, 1)
+    with override_settings(RATE_LIMITS={'bench': {'user': exhausted,
+                                                  'ip': exhausted}}):
+        limited(request)
+        rows.append(('rejected with 429',
+                     measure(lambda: limited(request), 2000)))
+    report('Time per request, us',
+           [(name, f'{value * 1000:.1f}') for name, value in rows])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Queries and latency of the read views, and throughput of the WSGI
+handler when several client threads request pages at once"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.utils import measure, report, setup
+
+
+def populate():
+    from posts.models import Comment, Follow, Group, Post, User
+    users = [User.objects.create_user(username=f'user{i}') for i in range(20)]
+    group = Group.objects.create(title='Bench', slug='bench')
+    posts = [Post.objects.create(text=f'post {i}', author=users[i % 20],
+                                 group=group if i % 2 else None)
+             for i in range(200)]
+    for i, post in enumerate(posts):
+        for j in range(i % 5):
+            Comment.objects.create(post=post, author=users[j], text='nice')
+    for user in users[1:]:
+        Follow.objects.create(user=users[0], author=user)
+    return users[0], posts[-1]
+
+
+def main(threads=(1, 2, 4, 8), requests=400):
+    setup()
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    reader, post = populate()
+    client = Client()
+    client.force_login(reader)
+    urls = {
+        'index': '/',
+        'group_posts': '/group/bench/',
+        'profile': f'/{post.author.username}/',
+        'post_view': f'/{post.author.username}/{post.id}/',
+        'follow_index': '/follow/',
+    }
+    rows = []
+    for name, url in urls.items():
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+        count = len(queries)
+        latency = measure(lambda: (cache.clear(), client.get(url)), 50)
+        rows.append((name, f'{count} queries, {latency:.2f} ms'))
+    report('Cold render of read views', rows)
+
+    rows = []
+    for count in threads:
+        clients = [Client() for _ in range(count)]
+        for each in clients:
+            each.force_login(reader)
+        pages = list(urls.values())
+
+        def fetch(i):
+            clients[i % count].get(pages[i % len(pages)])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(count) as pool:
+            list(pool.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - start
+        rows.append((f'{count} threads', f'{requests / elapsed:.0f} req/s'))
+    report('WSGI handler throughput', rows)
+
+
+if __name__ == '__main__':
+    main(requests=int(sys.argv[1]) if len(sys.argv) > 1 else 400)
@@ -0,0 +1,36 @@
+"""Render time of every template and include on the read views
+
+Run with YATUBE_DEBUG=0 to profile the cached template loader:
+python -m benchmarks.profile_templates [renders per page]
+"""
+import sys
+
+from benchmarks.bench_views import populate
+from benchmarks.utils import setup
+
+
+def main(repeat=20):
+    setup()
+    from django.core.cache import cache
+    from django.test import Client, override_settings
+    from yatube.template_profile import profile
+    # без collectstatic манифеста хэшированных имён нет
+    override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.'
+                      'storage.StaticFilesStorage').enable()
+    reader, post = populate()
+    client = Client()
+    client.force_login(reader)
+    urls = ['/', '/group/bench/', f'/{post.author.username}/',
+            f'/{post.author.username}/{post.id}/', '/follow/']
+    with profile() as stats:
+        for url in urls:
+            for _ in range(repeat):
+                # иначе страницы отдаются из кэша без рендера
+                cache.clear()
+                client.get(url)
+    print(f'{len(urls)} pages rendered {repeat} times each')
+    print(stats.report())
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,102 @@
+"""Cold start of a process: wall time of django.setup(), of loading the
+WSGI application and of a management command, and the -X importtime
+report of django.setup() grouped by top-level package
+
+Run from the project root: python -m benchmarks.startup
+Compare YATUBE_DEBUG=1 and YATUBE_DEBUG=0, the debug toolbar is only
+loaded in the first one. Starts slower than STARTUP_BUDGET are marked
+and make the script exit with status 1, so it can gate a release; wall
+time is too noisy for the test suite to check it.
+
+Django 2.2 imports distutils. When setuptools replaces it with its own
+copy, all of setuptools is imported too, over 100 ms. Start processes
+with SETUPTOOLS_USE_DISTUTILS=stdlib to avoid that.
+"""
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from benchmarks.utils import report
+
+SETUP = 'import django; django.setup()'
+COMMANDS = {
+    'django.setup()': [sys.executable, '-c', SETUP],
+    'import yatube.wsgi': [sys.executable, '-c', 'import yatube.wsgi'],
+    'manage.py check': [sys.executable, 'manage.py', 'check'],
+}
+# модули, которых не должно быть в процессе сразу после старта
+OPTIONAL = ['debug_toolbar', 'PIL', 'django.test', 'yatube.keys',
+            'yatube.flatpages', 'sorl.thumbnail.images']
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def environ():
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    return env
+
+
+def wall(command, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, env=environ(), check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def import_times():
+    """Self time of imports by package and cumulative time of the
+    imports made directly by django.setup() and the code it runs"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         SETUP + '; import sys; print(" ".join(sys.modules))'],
+        env=environ(), check=True, capture_output=True, text=True)
+    packages, top = Counter(), Counter()
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match is None:
+            continue
+        own, total, indent, name = match.groups()
+        packages[name.split('.')[0]] += int(own)
+        if not indent:
+            top[name] += int(total)
+    return packages, top, set(result.stdout.split())
+
+
+def budget():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    from django.conf import settings
+    return settings.STARTUP_BUDGET * 1000
+
+
+def main(repeat=5):
+    """Prints the report, returns False when a start is over budget"""
+    limit = budget()
+    rows = []
+    within = True
+    for name, command in COMMANDS.items():
+        elapsed = wall(command, repeat)
+        within = within and elapsed <= limit
+        rows.append((name, f'{elapsed:.0f} ms'
+                     + (' over budget' if elapsed > limit else '')))
+    report(f'Cold start, best of {repeat}, budget {limit:.0f} ms', rows)
+    packages, top, modules = import_times()
+    report(f'Imports of django.setup(), '
+           f'{sum(packages.values()) / 1000:.0f} ms in total, by package',
+           [(name, f'{own / 1000:.1f} ms')
+            for name, own in packages.most_common(12)])
+    report('Largest top-level imports',
+           [(name, f'{total / 1000:.1f} ms')
+            for name, total in top.most_common(12)])
+    report('Optional modules loaded at start',
+           [(name, name in modules) for name in OPTIONAL])
+    return within
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
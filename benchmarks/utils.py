@@ -0,0 +1,35 @@
+"""Helpers shared by benchmark scripts
+
+Run a benchmark from the project root: python -m benchmarks.bench_views
+"""
+import os
+import statistics
+import time
+
+import django
+
+
+def setup():
+    """Configures Django and creates an empty test database"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment(debug=False)
+    connection.creation.create_test_db(verbosity=0)
+
+
+def measure(func, repeat=200):
+    """Runs func repeatedly, returns the median time of one call in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def report(title, rows):
+    print(title)
+    for name, value in rows:
+        print(f'  {name:<32} {value}')
@@ -0,0 +1,5 @@
+from yatube.testing import test_settings
+
+
+def pytest_configure(config):
+    test_settings().enable()
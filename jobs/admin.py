@@ -0,0 +1,22 @@
+from django.contrib import admin
+from .models import Job, QueuedMail
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'status', 'attempts', 'run_after',)
+    search_fields = ('name', 'key',)
+    list_filter = ('status', 'name',)
+    empty_value_display = '-пусто-'
+
+
+class QueuedMailAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'subject', 'status', 'attempts', 'send_after',)
+    list_filter = ('status',)
+    empty_value_display = '-пусто-'
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(Job, JobAdmin)
+admin.site.register(QueuedMail, QueuedMailAdmin)
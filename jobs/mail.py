@@ -0,0 +1,160 @@
+"""Outbound mail queue
+
+QueuedEmailBackend, the EMAIL_BACKEND of the site, only stores messages
+in the QueuedMail table, so a request never waits for the mail server.
+The flush_mail task claims due messages in batches of MAIL_BATCH_SIZE
+and sends them over one connection of MAIL_DELIVERY_BACKEND. A message
+that fails is retried with the backoff of the job queue, after
+MAIL_MAX_ATTEMPTS attempts it stays in the table as failed.
+"""
+import base64
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job, QueuedMail
+from .queue import retry_delay, task
+
+logger = logging.getLogger(__name__)
+
+
+def serialize(message):
+    """JSON payload of an EmailMessage, attachments are (filename,
+    content, mimetype) tuples"""
+    attachments = []
+    for filename, content, mimetype in message.attachments:
+        if isinstance(content, str):
+            content = content.encode()
+        attachments.append([filename, base64.b64encode(content).decode(),
+                            mimetype])
+    return json.dumps({
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'alternatives': getattr(message, 'alternatives', []),
+        'content_subtype': message.content_subtype,
+        'attachments': attachments,
+    })
+
+
+def deserialize(payload):
+    fields = json.loads(payload)
+    attachments = fields.pop('attachments')
+    content_subtype = fields.pop('content_subtype')
+    fields['alternatives'] = [tuple(alternative)
+                              for alternative in fields['alternatives']]
+    message = EmailMultiAlternatives(**fields)
+    message.content_subtype = content_subtype
+    for filename, content, mimetype in attachments:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Queues messages for the flush_mail task instead of sending them"""
+
+    def send_messages(self, email_messages):
+        mails = [QueuedMail(payload=serialize(message))
+                 for message in email_messages if message.recipients()]
+        if not mails:
+            return 0
+        try:
+            QueuedMail.objects.bulk_create(mails)
+            schedule_flush(settings.MAIL_FLUSH_DELAY)
+        except DatabaseError:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(mails)
+
+
+def schedule_flush(delay=0):
+    # одной задачи в очереди хватает на все письма
+    if not Job.objects.filter(name=flush_mail.task_name,
+                              status=Job.QUEUED).exists():
+        flush_mail.enqueue(delay=delay)
+
+
+def claim(limit):
+    """Takes up to limit due messages for this worker. A message whose
+    lease expired MAIL_MAX_ATTEMPTS times is marked as failed: it may be
+    the one crashing the workers"""
+    now = timezone.now()
+    QueuedMail.objects.filter(
+        status=QueuedMail.SENDING, send_after__lte=now,
+        attempts__gte=settings.MAIL_MAX_ATTEMPTS,
+    ).update(status=QueuedMail.FAILED,
+             last_error='Worker lease expired too many times')
+    due = list(QueuedMail.objects.filter(
+        status__in=(QueuedMail.QUEUED, QueuedMail.SENDING),
+        send_after__lte=now, attempts__lt=settings.MAIL_MAX_ATTEMPTS,
+    ).values_list('pk', flat=True)[:limit])
+    if not due:
+        return []
+    # время окончания захвата служит его меткой
+    lease = now + timedelta(seconds=settings.JOBS_LEASE)
+    QueuedMail.objects.filter(
+        pk__in=due, status__in=(QueuedMail.QUEUED, QueuedMail.SENDING),
+        send_after__lte=now, attempts__lt=settings.MAIL_MAX_ATTEMPTS,
+    ).update(status=QueuedMail.SENDING, send_after=lease,
+             attempts=F('attempts') + 1)
+    return list(QueuedMail.objects.filter(
+        pk__in=due, status=QueuedMail.SENDING, send_after=lease))
+
+
+def failed(mail):
+    logger.exception('Mail %s was not sent', mail.pk)
+    owned = QueuedMail.objects.filter(pk=mail.pk, status=QueuedMail.SENDING,
+                                      send_after=mail.send_after)
+    error = traceback.format_exc()
+    if mail.attempts >= settings.MAIL_MAX_ATTEMPTS:
+        owned.update(status=QueuedMail.FAILED, last_error=error)
+    else:
+        owned.update(status=QueuedMail.QUEUED, last_error=error,
+                     send_after=timezone.now() + timedelta(
+                         seconds=retry_delay(mail.attempts)))
+
+
+@task
+def flush_mail():
+    """Sends all due queued messages, returns the number of sent ones"""
+    sent = 0
+    # соединение открывается до захвата писем: если сервер недоступен,
+    # задача повторится, а письма останутся в очереди
+    with get_connection(settings.MAIL_DELIVERY_BACKEND) as connection:
+        while True:
+            batch = claim(settings.MAIL_BATCH_SIZE)
+            if not batch:
+                break
+            delivered = []
+            for mail in batch:
+                try:
+                    connection.send_messages([deserialize(mail.payload)])
+                except Exception:
+                    failed(mail)
+                else:
+                    delivered.append(mail.pk)
+            QueuedMail.objects.filter(
+                pk__in=delivered, status=QueuedMail.SENDING,
+                send_after=batch[0].send_after).delete()
+            sent += len(delivered)
+    # письма упавшего воркера ждут конца его захвата
+    retry = (QueuedMail.objects.filter(status__in=(QueuedMail.QUEUED,
+                                                   QueuedMail.SENDING))
+             .values_list('send_after', flat=True).first())
+    if retry is not None:
+        schedule_flush(max((retry - timezone.now()).total_seconds(), 0))
+    return sent
@@ -0,0 +1,48 @@
+from multiprocessing import Process
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.queue import run_pending, serve
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs with a pool of workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=settings.JOBS_PROCESSES,
+                            help='Number of worker processes')
+        parser.add_argument('--threads', type=int,
+                            default=settings.JOBS_THREADS,
+                            help='Number of worker threads in every process')
+        parser.add_argument('--poll', type=float,
+                            default=settings.JOBS_POLL_INTERVAL,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Run due jobs in this process and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            count = run_pending()
+            self.stdout.write(f'Выполнено задач: {count}')
+            return
+        processes, threads = options['processes'], options['threads']
+        self.stdout.write(f'Воркеров: {processes} x {threads}, '
+                          f'остановка по Ctrl+C')
+        if processes <= 1:
+            serve(threads, options['poll'])
+            return
+        # дочерние процессы не должны делить соединения с родителем
+        connections.close_all()
+        pool = [Process(target=serve, args=(threads, options['poll']))
+                for _ in range(processes)]
+        for process in pool:
+            process.start()
+        try:
+            for process in pool:
+                process.join()
+        except KeyboardInterrupt:
+            for process in pool:
+                process.join()
@@ -0,0 +1,84 @@
+import json
+
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Job model, a row of the queue table"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Задача', max_length=200)
+    payload = models.TextField('Аргументы', default='{}')
+    status = models.CharField('Статус', max_length=10, choices=STATUSES,
+                              default=QUEUED)
+    attempts = models.PositiveIntegerField('Попытки', default=0)
+    # для задачи в очереди — когда её можно начать,
+    # для выполняемой — когда истекает захват воркером
+    run_after = models.DateTimeField('Запуск после', default=timezone.now)
+    key = models.CharField('Ключ идемпотентности', max_length=200,
+                           unique=True, blank=True, null=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+    @property
+    def args(self):
+        return json.loads(self.payload).get('args', [])
+
+    @property
+    def kwargs(self):
+        return json.loads(self.payload).get('kwargs', {})
+
+    class Meta:
+        ordering = ('run_after', 'id')
+        indexes = [models.Index(fields=['status', 'run_after'])]
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+
+
+class QueuedMail(models.Model):
+    """Outgoing message waiting for the flush_mail task, the payload
+    keeps the fields of the EmailMessage as JSON"""
+    QUEUED = 'queued'
+    SENDING = 'sending'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (SENDING, 'Отправляется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    payload = models.TextField('Письмо')
+    status = models.CharField('Статус', max_length=10, choices=STATUSES,
+                              default=QUEUED)
+    attempts = models.PositiveIntegerField('Попытки', default=0)
+    # как у задач: для письма в очереди — когда его можно отправлять,
+    # для отправляемого — когда истекает захват воркером
+    send_after = models.DateTimeField('Отправка после', default=timezone.now)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создано', auto_now_add=True)
+
+    def __str__(self):
+        return self.subject
+
+    @property
+    def subject(self):
+        return json.loads(self.payload).get('subject', '')
+
+    class Meta:
+        ordering = ('send_after', 'id')
+        indexes = [models.Index(fields=['status', 'send_after'])]
+        verbose_name = 'Письмо'
+        verbose_name_plural = 'Очередь писем'
@@ -0,0 +1,167 @@
+"""Durable job queue on top of the database
+
+Request handlers only insert a row with enqueue(), the run_workers
+command claims due rows and runs the registered tasks. A failed job is
+retried with exponential backoff, a job of a crashed worker is claimed
+again once its lease runs out.
+"""
+import json
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (IntegrityError, OperationalError,
+                       close_old_connections, connection, transaction)
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# сколько строк просматривать за одну попытку захвата
+CLAIM_BATCH = 10
+
+registry = {}
+
+
+def task(func):
+    """Registers a function as a task. Calls are queued with
+    func.enqueue(*args, key=None, delay=0, **kwargs), arguments have to
+    be JSON serializable"""
+    name = f'{func.__module__}.{func.__name__}'
+    registry[name] = func
+
+    def enqueue_call(*args, key=None, delay=0, **kwargs):
+        return enqueue(name, args, kwargs, key=key, delay=delay)
+
+    func.task_name = name
+    func.enqueue = enqueue_call
+    return func
+
+
+def enqueue(name, args=(), kwargs=None, key=None, delay=0):
+    """Queues a task call. A job with the same idempotency key is queued
+    only once, the existing one is returned instead"""
+    if name not in registry:
+        raise LookupError(f'Unknown task {name}')
+    job = Job(name=name, key=key,
+              payload=json.dumps({'args': list(args),
+                                  'kwargs': kwargs or {}}),
+              run_after=timezone.now() + timedelta(seconds=delay))
+    if key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return Job.objects.get(key=key)
+    return job
+
+
+def retry_delay(attempts):
+    delay = settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1)
+    return min(delay, settings.JOBS_RETRY_MAX_DELAY)
+
+
+def claim():
+    """Takes the next due job for this worker, returns None when there
+    is nothing to do"""
+    now = timezone.now()
+    due = (Job.objects.filter(status__in=(Job.QUEUED, Job.RUNNING),
+                              run_after__lte=now)
+           .values_list('pk', 'status', 'run_after')[:CLAIM_BATCH])
+    lease = now + timedelta(seconds=settings.JOBS_LEASE)
+    for pk, status, run_after in due:
+        # строку мог захватить другой воркер, тогда update ничего не найдёт
+        claimed = Job.objects.filter(
+            pk=pk, status=status, run_after=run_after,
+        ).update(status=Job.RUNNING, run_after=lease,
+                 attempts=F('attempts') + 1)
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run(job):
+    """Runs a claimed job, returns whether it succeeded"""
+    # число попыток служит меткой захвата: если аренда истекла и задачу
+    # взял другой воркер, результат этого запуска не записывается
+    owned = Job.objects.filter(pk=job.pk, status=Job.RUNNING,
+                               attempts=job.attempts)
+    try:
+        if job.attempts > settings.JOBS_MAX_ATTEMPTS:
+            raise RuntimeError('Worker lease expired too many times')
+        func = registry.get(job.name)
+        if func is None:
+            raise LookupError(f'Unknown task {job.name}')
+        func(*job.args, **job.kwargs)
+    except Exception:
+        logger.exception('Job %s failed', job)
+        error = traceback.format_exc()
+        if job.attempts >= settings.JOBS_MAX_ATTEMPTS:
+            owned.update(status=Job.FAILED, last_error=error)
+        else:
+            owned.update(status=Job.QUEUED, last_error=error,
+                         run_after=timezone.now() + timedelta(
+                             seconds=retry_delay(job.attempts)))
+        return False
+    if job.key is None:
+        owned.delete()
+    else:
+        # строка с ключом остаётся, чтобы повторная постановка
+        # не выполнила задачу ещё раз
+        owned.update(status=Job.DONE, last_error='')
+    return True
+
+
+def run_pending(limit=None):
+    """Runs due jobs in the current thread until the queue is drained,
+    returns the number of jobs run"""
+    count = 0
+    while limit is None or count < limit:
+        job = claim()
+        if job is None:
+            break
+        run(job)
+        count += 1
+    return count
+
+
+def work(stop, poll):
+    """Worker loop, runs jobs until the stop event is set"""
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            job = claim()
+        except OperationalError:
+            # база занята другим писателем, попробуем позже
+            logger.warning('Job queue is locked', exc_info=True)
+            job = None
+        if job is None:
+            stop.wait(poll)
+        else:
+            run(job)
+    connection.close()
+
+
+def serve(threads, poll):
+    """Runs a pool of worker threads until interrupted"""
+    stop = threading.Event()
+    pool = [threading.Thread(target=work, args=(stop, poll), daemon=True)
+            for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in pool):
+            for thread in pool:
+                thread.join(poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for thread in pool:
+            thread.join()
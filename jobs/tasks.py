@@ -0,0 +1,3 @@
+"""Background tasks of the jobs app"""
+# задача доставки писем регистрируется при импорте
+from .mail import flush_mail  # noqa
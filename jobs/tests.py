@@ -0,0 +1,209 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives, send_mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from jobs.mail import flush_mail
+from jobs.models import Job, QueuedMail
+from jobs.queue import claim, enqueue, run, run_pending, task
+
+calls = []
+
+
+@task
+def remember(value):
+    calls.append(value)
+
+
+@task
+def explode():
+    raise ValueError('boom')
+
+
+@override_settings(JOBS_MAX_ATTEMPTS=3, JOBS_RETRY_DELAY=10,
+                   JOBS_RETRY_MAX_DELAY=15, JOBS_LEASE=60)
+class TestJobQueue(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_only_stores_job(self):
+        job = remember.enqueue('first')
+        self.assertEqual(calls, [])
+        self.assertEqual(job.args, ['first'])
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, ['first'])
+        # задачи без ключа после выполнения удаляются
+        self.assertFalse(Job.objects.exists())
+
+    def test_unknown_task(self):
+        with self.assertRaises(LookupError):
+            enqueue('jobs.tests.missing')
+
+    def test_idempotency_key(self):
+        first = remember.enqueue('once', key='remember:once')
+        second = remember.enqueue('once', key='remember:once')
+        self.assertEqual(first.pk, second.pk)
+        run_pending()
+        remember.enqueue('once', key='remember:once')
+        self.assertEqual(run_pending(), 0)
+        self.assertEqual(calls, ['once'])
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_delayed_job_waits(self):
+        remember.enqueue('later', delay=60)
+        self.assertEqual(run_pending(), 0)
+        Job.objects.update(run_after=timezone.now())
+        self.assertEqual(run_pending(), 1)
+
+    def test_retries_with_backoff(self):
+        explode.enqueue()
+        delays = []
+        for attempt in range(3):
+            started = timezone.now()
+            self.assertFalse(run(claim()))
+            job = Job.objects.get()
+            delays.append(round((job.run_after - started).total_seconds()))
+            Job.objects.update(run_after=timezone.now())
+        self.assertEqual(delays[:2], [10, 15])
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertIn('ValueError: boom', job.last_error)
+        self.assertIsNone(claim())
+
+    def test_expired_lease_is_claimed_again(self):
+        remember.enqueue('lost')
+        lost = claim()
+        self.assertIsNone(claim())
+        Job.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+        again = claim()
+        self.assertEqual(again.pk, lost.pk)
+        self.assertEqual(again.attempts, 2)
+        # первый воркер закончил после истечения аренды, его итог не важен
+        self.assertTrue(run(lost))
+        self.assertTrue(Job.objects.filter(pk=lost.pk).exists())
+        self.assertTrue(run(again))
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(calls, ['lost', 'lost'])
+
+    def test_run_workers_once(self):
+        remember.enqueue(1)
+        remember.enqueue(2)
+        out = StringIO()
+        call_command('run_workers', '--once', stdout=out)
+        self.assertEqual(calls, [1, 2])
+        self.assertIn('2', out.getvalue())
+
+
+class FlakyBackend(EmailBackend):
+    """Test delivery backend counting connections, mail to bounce@ fails"""
+    opened = 0
+
+    def open(self):
+        FlakyBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'bounce@example.com' in message.recipients():
+                raise ConnectionError('mailbox unavailable')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='jobs.mail.QueuedEmailBackend',
+                   MAIL_DELIVERY_BACKEND='jobs.tests.FlakyBackend',
+                   MAIL_BATCH_SIZE=2, MAIL_MAX_ATTEMPTS=2, MAIL_FLUSH_DELAY=0,
+                   JOBS_RETRY_DELAY=10, JOBS_RETRY_MAX_DELAY=15)
+class TestMailQueue(TestCase):
+    def setUp(self):
+        FlakyBackend.opened = 0
+
+    def test_request_only_queues(self):
+        get_user_model().objects.create_user(
+            username='forgetful', email='forgetful@example.com',
+            password='secret')
+        response = self.client.post(reverse('password_reset'),
+                                    {'email': 'forgetful@example.com'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(QueuedMail.objects.count(), 1)
+        send_mail('Hello', 'text', 'site@example.com', ['a@example.com'])
+        # одна задача на все письма в очереди
+        self.assertEqual(Job.objects.filter(name=flush_mail.task_name)
+                         .count(), 1)
+        run_pending()
+        self.assertEqual([message.to for message in mail.outbox],
+                         [['forgetful@example.com'], ['a@example.com']])
+        self.assertIn('forgetful', mail.outbox[0].body)
+        self.assertFalse(QueuedMail.objects.exists())
+
+    def test_batches_over_one_connection(self):
+        message = EmailMultiAlternatives(
+            'Привет', 'текст', 'site@example.com', ['a@example.com'],
+            bcc=['b@example.com'], headers={'X-Tag': 'news'})
+        message.attach_alternative('<p>текст</p>', 'text/html')
+        message.attach('note.txt', 'заметка', 'text/plain')
+        for _ in range(5):
+            message.send()
+        run_pending()
+        self.assertEqual(FlakyBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        sent = mail.outbox[0]
+        self.assertEqual(sent.recipients(), ['a@example.com', 'b@example.com'])
+        self.assertEqual(sent.alternatives, [('<p>текст</p>', 'text/html')])
+        self.assertEqual(sent.attachments,
+                         [('note.txt', 'заметка', 'text/plain')])
+        self.assertEqual(sent.message()['X-Tag'], 'news')
+
+    def test_failed_message_retried(self):
+        send_mail('Hi', 'text', 'site@example.com', ['bounce@example.com'])
+        send_mail('Hi', 'text', 'site@example.com', ['a@example.com'])
+        run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        bounced = QueuedMail.objects.get()
+        self.assertEqual((bounced.status, bounced.attempts),
+                         (QueuedMail.QUEUED, 1))
+        self.assertIn('mailbox unavailable', bounced.last_error)
+        retry = Job.objects.get(name=flush_mail.task_name)
+        self.assertGreater(retry.run_after, timezone.now())
+        QueuedMail.objects.update(send_after=timezone.now())
+        Job.objects.update(run_after=timezone.now())
+        run_pending()
+        self.assertEqual(QueuedMail.objects.get().status, QueuedMail.FAILED)
+        self.assertFalse(Job.objects.exists())
+
+    def test_crashed_worker_mail_resent(self):
+        send_mail('Hi', 'text', 'site@example.com', ['a@example.com'])
+        Job.objects.all().delete()
+        # воркер захватил письмо и упал, не отправив его
+        lease = timezone.now() + timedelta(seconds=60)
+        QueuedMail.objects.update(status=QueuedMail.SENDING,
+                                  send_after=lease, attempts=1)
+        self.assertEqual(flush_mail(), 0)
+        retry = Job.objects.get(name=flush_mail.task_name)
+        self.assertGreater(retry.run_after, timezone.now())
+        QueuedMail.objects.update(send_after=timezone.now())
+        Job.objects.update(run_after=timezone.now())
+        run_pending()
+        self.assertEqual([message.to for message in mail.outbox],
+                         [['a@example.com']])
+        self.assertFalse(QueuedMail.objects.exists())
+
+    def test_mail_crashing_workers_given_up(self):
+        send_mail('Hi', 'text', 'site@example.com', ['a@example.com'])
+        Job.objects.all().delete()
+        # письмо роняет воркер при каждой попытке, аренда истекает
+        QueuedMail.objects.update(status=QueuedMail.SENDING,
+                                  send_after=timezone.now(), attempts=2)
+        self.assertEqual(flush_mail(), 0)
+        lost = QueuedMail.objects.get()
+        self.assertEqual(lost.status, QueuedMail.FAILED)
+        self.assertIn('lease expired', lost.last_error)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(mail.outbox, [])
@@ -1,37 +1,143 @@
+import hashlib
+
 from django.contrib import admin
-from .models import Comment, Follow, Group, Post
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from . import deletion
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                     Post)
+
+# сколько секунд список в админке показывает старое число строк
+COUNT_TIMEOUT = 60
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator reusing the row count of a changelist query for
+    COUNT_TIMEOUT seconds, a big table is not counted on every page"""
+
+    @cached_property
+    def count(self):
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        digest = hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+        return cache.get_or_set(f'admin:count:{digest}',
+                                self.object_list.count, COUNT_TIMEOUT)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist for big tables: no second count of the whole table,
+    an approximate count of the filtered rows, related objects picked
+    with autocomplete instead of dropdowns of all rows"""
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+
+class SoftDeleteAdmin(LargeTableAdmin):
+    """Lists soft deleted rows too, deleting only marks rows as deleted
+    and the restore action brings them back within the grace window"""
+    actions = ['restore']
+
+    def get_queryset(self, request):
+        queryset = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
+    def delete_model(self, request, obj):
+        deletion.trash(self.model.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        deletion.trash(queryset)
+
+    def restore(self, request, queryset):
+        deletion.restore(queryset)
+    restore.short_description = 'Восстановить удалённые'
 
 
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(SoftDeleteAdmin):
     """Post fields that are displayed in the admin panel"""
-    list_display = ("pk", "text", "pub_date", "author")
+    list_display = ("pk", "text", "pub_date", "author", "is_deleted")
+    list_select_related = ("author",)
     search_fields = ("text",)
-    list_filter = ("pub_date",)
+    list_filter = ("pub_date", "is_deleted")
+    autocomplete_fields = ("author", "group")
     empty_value_display = "-пусто-"
 
 
 class GroupAdmin(admin.ModelAdmin):
     """Group fields that are displayed in the admin panel"""
     list_display = ("title", "slug", "description")
-    search_fields = ("text",)
+    search_fields = ("title", "=slug")
     empty_value_display = "-пусто-"
 
+    def delete_model(self, request, obj):
+        deletion.delete_group(obj)
+
+    def delete_queryset(self, request, queryset):
+        for group in queryset:
+            deletion.delete_group(group)
 
-class CommentAdmin(admin.ModelAdmin):
-    list_display = ('post', 'author', 'text',)
+
+class CommentAdmin(SoftDeleteAdmin):
+    list_display = ('post', 'author', 'text', 'is_deleted')
+    list_select_related = ('post', 'author')
     search_fields = ('text',)
-    list_filter = ('created',)
+    list_filter = ('created', 'is_deleted')
+    autocomplete_fields = ('post', 'author')
     empty_value_display = '-пусто-'
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
+    """Follows are found by the exact username of the follower or the
+    author, the lookup goes through the unique index of usernames"""
     list_display = ('user', 'author',)
-    search_fields = ('author',)
-    list_filter = ('user', 'author',)
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
+    empty_value_display = '-пусто-'
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.filter(Q(user__username=search_term)
+                               | Q(author__username=search_term)), False
+
+
+class ArchivedPostAdmin(LargeTableAdmin):
+    """Archived posts are moved by the archive_posts command only"""
+    list_display = ('pk', 'text', 'pub_date', 'author', 'archived')
+    list_select_related = ('author',)
+    search_fields = ('text',)
+    list_filter = ('pub_date',)
+    autocomplete_fields = ('author', 'group')
     empty_value_display = '-пусто-'
 
+    def has_add_permission(self, request):
+        return False
+
+
+class ArchivedCommentAdmin(SoftDeleteAdmin):
+    list_display = ('post', 'author', 'text', 'is_deleted')
+    list_select_related = ('post', 'author')
+    search_fields = ('text',)
+    list_filter = ('is_deleted',)
+    autocomplete_fields = ('post', 'author')
+    empty_value_display = '-пусто-'
+
+    def has_add_permission(self, request):
+        return False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(ArchivedPost, ArchivedPostAdmin)
+admin.site.register(ArchivedComment, ArchivedCommentAdmin)
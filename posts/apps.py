@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from . import signals  # noqa
+        # регистрирует hole post_owner до первого заполнения страницы
+        from .templatetags import post_cards  # noqa
@@ -0,0 +1,134 @@
+"""Archive of old posts
+
+The archive_posts command moves posts older than ARCHIVE_AFTER_DAYS with
+their comments to the ArchivedPost and ArchivedComment tables, so the
+live tables and their indexes hold recent posts only. Feeds read the
+live table first and reach the archive only on the pages past its end.
+Counts of archived posts are cached until the archive changes, but no
+longer than ARCHIVE_COUNT_TIMEOUT: archive_posts runs in a process of its
+own and web processes with their own caches see its moves only then.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import transaction
+from django.http import Http404
+
+from . import deletion, group_stats, page_cache, trending
+from .models import ArchivedComment, ArchivedPost, Comment, Post
+
+VERSION_KEY = 'archive:version'
+BATCH_SIZE = 500
+POST_FIELDS = ['id', 'text', 'pub_date', 'author_id', 'group_id', 'image',
+               'hot']
+COMMENT_FIELDS = ['id', 'post_id', 'author_id', 'text', 'created',
+                  'is_deleted', 'deleted_at']
+
+
+def version():
+    # после вытеснения ключа версия начинается с нового значения,
+    # а не с уже использованной единицы
+    return cache.get_or_set(VERSION_KEY, time.time_ns, None)
+
+
+def invalidate():
+    """Drops cached counts, call it after any change of the archive"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def count(queryset):
+    """Cached number of rows of a queryset over the archive"""
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    digest = hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    return cache.get_or_set(f'archive:count:{version()}:{digest}',
+                            queryset.count, settings.ARCHIVE_COUNT_TIMEOUT)
+
+
+class Feed:
+    """Live posts followed by archived ones. It is counted and sliced
+    like a queryset, so the standard Paginator pages through both"""
+
+    def __init__(self, live, archived, live_count=None):
+        self.live = live
+        self.archived = archived
+        self._live_count = live_count
+
+    def live_count(self):
+        if self._live_count is None:
+            self._live_count = self.live.count()
+        return self._live_count
+
+    def archived_count(self):
+        return count(self.archived)
+
+    def count(self):
+        return self.live_count() + self.archived_count()
+
+    def __getitem__(self, key):
+        # Paginator берёт только срезы
+        start, stop = key.start or 0, key.stop
+        live = self.live_count()
+        posts = list(self.live[start:min(stop, live)]) if start < live else []
+        if stop > live:
+            posts += self.archived[max(start - live, 0):stop - live]
+        return posts
+
+
+def get_post(**lookup):
+    """Live post or, once it is archived, the archived one"""
+    for model in (Post, ArchivedPost):
+        try:
+            return model.objects.select_related('author', 'group').get(
+                **lookup)
+        except model.DoesNotExist:
+            pass
+    raise Http404('No post matches the given query.')
+
+
+def archive(before, batch_size=BATCH_SIZE):
+    """Moves posts published before the date with their comments to the
+    archive, a batch per transaction. Returns the numbers of moved posts
+    and comments"""
+    moved_posts = moved_comments = 0
+    groups = set()
+    while True:
+        with transaction.atomic():
+            # удалённые посты остаются в живой таблице до purge_deleted
+            posts = list(Post.objects.filter(pub_date__lt=before)
+                         .order_by('pub_date', 'pk')
+                         .values(*POST_FIELDS)[:batch_size])
+            if not posts:
+                break
+            ids = [post['id'] for post in posts]
+            ArchivedPost.objects.bulk_create(
+                ArchivedPost(**post) for post in posts)
+            # удалённые комментарии переезжают с отметкой, их срок
+            # ожидания purge_deleted не меняется
+            thread = [ArchivedComment(**comment) for comment
+                      in Comment.all_objects.filter(post_id__in=ids)
+                      .order_by().values(*COMMENT_FIELDS)]
+            ArchivedComment.all_objects.bulk_create(thread)
+            # без сигналов: картинки и миниатюры остаются архивным постам
+            deletion.raw_delete(Comment.all_objects.filter(post_id__in=ids))
+            deletion.raw_delete(Post.objects.filter(pk__in=ids))
+        moved_posts += len(posts)
+        moved_comments += sum(not comment.is_deleted for comment in thread)
+        groups.update(post['group_id'] for post in posts)
+    if moved_posts:
+        invalidate()
+        page_cache.invalidate()
+        group_stats.invalidate(*groups)
+        group_stats.invalidate_index()
+        trending.rebuild()
+        for group_id in groups - {None}:
+            trending.rebuild(group_id)
+    return moved_posts, moved_comments
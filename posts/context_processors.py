@@ -1,7 +1,16 @@
 import datetime as dt
+import time
+
+# (год, момент следующего нового года), общий для всего процесса
+_year = (None, 0)
 
 
 def year(request):
-    """Function for getting current year"""
-    year = dt.datetime.now().year
-    return {'year': year, }
+    """Function for getting current year, recomputed once a year"""
+    global _year
+    value, until = _year
+    if time.time() >= until:
+        now = dt.datetime.now()
+        value = now.year
+        _year = value, dt.datetime(value + 1, 1, 1).timestamp()
+    return {'year': value, }
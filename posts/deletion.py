@@ -0,0 +1,190 @@
+"""Set-based deletes of posts, users and groups
+
+Model.delete() makes Django's collector load every related row into
+memory and send signals row by row, which does not scale to an author
+with a hundred thousand posts. Here rows are deleted by primary key in
+chunks, one DELETE per table and chunk and no per-row signals, so memory
+is bounded by the chunk size. Every chunk is a transaction of its own:
+an interrupted delete is finished by running it again. Images are
+released by a background job, caches and counters are updated once per
+chunk or once per delete.
+
+Posts and comments deleted by their authors and moderators are only
+soft deleted: trash() marks them with a tombstone the default managers
+filter out, restore() brings them back. purge() hard deletes tombstones
+older than the grace window in small chunks, it is run off-peak by the
+purge_deleted command.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import archive, group_stats, page_cache, tasks, trending
+from .follow_graph import graph
+from .models import ArchivedComment, ArchivedPost, Comment, Follow, Post
+
+# SQLite ограничивает число параметров запроса 999
+CHUNK_SIZE = 500
+# чистка идёт малыми порциями с паузами, чтобы не держать блокировку SQLite
+PURGE_CHUNK_SIZE = 100
+
+
+def raw_delete(queryset):
+    """Deletes the rows of a queryset with a single DELETE, returns their
+    number. Unlike QuerySet.delete() it neither collects related rows
+    nor sends signals: the caller deletes dependent rows first and
+    updates the caches itself"""
+    # единственное место, где используется приватный API Django
+    return queryset._raw_delete(queryset.db)
+
+
+def _chunks(queryset, fields, chunk_size):
+    """Rows of the queryset as values_list tuples, a chunk at a time in
+    the order of primary keys, the first field has to be the key"""
+    last = None
+    while True:
+        rows = queryset.order_by('pk')
+        if last is not None:
+            rows = rows.filter(pk__gt=last)
+        rows = list(rows.values_list(*fields)[:chunk_size])
+        if rows:
+            last = rows[-1][0]
+            yield rows
+        if len(rows) < chunk_size:
+            return
+
+
+def _delete_posts(posts, comments, chunk_size, pause=0):
+    """Deletes posts of a live or archived queryset with their comments,
+    tombstones included, returns the numbers of deleted posts and
+    comments and the groups of the posts"""
+    deleted_posts = deleted_comments = 0
+    groups = set()
+    for rows in _chunks(posts, ('pk', 'group_id', 'image'), chunk_size):
+        ids = [pk for pk, group_id, image in rows]
+        with transaction.atomic():
+            deleted_comments += raw_delete(
+                comments._base_manager.filter(post_id__in=ids))
+            deleted_posts += raw_delete(posts.model._base_manager.filter(
+                pk__in=ids))
+            images = {image for pk, group_id, image in rows if image}
+            if images:
+                # задача видна воркерам только после фиксации транзакции
+                tasks.release_images.enqueue(*sorted(images))
+        groups.update(group_id for pk, group_id, image in rows)
+        if pause:
+            time.sleep(pause)
+    return deleted_posts, deleted_comments, groups - {None}
+
+
+def _refresh(groups):
+    """Brings cached stats and trending lists up to date after posts of
+    the groups are deleted"""
+    group_stats.invalidate(*groups)
+    group_stats.invalidate_index()
+    trending.rebuild()
+    for group_id in groups:
+        trending.rebuild(group_id)
+
+
+def delete_user(user, chunk_size=CHUNK_SIZE):
+    """Deletes a user with everything the user wrote and their follows,
+    returns the numbers of deleted rows by kind"""
+    deleted = dict.fromkeys(['posts', 'comments', 'archived_posts',
+                             'archived_comments', 'follows'], 0)
+    posts, comments, groups = _delete_posts(
+        Post.all_objects.filter(author=user), Comment, chunk_size)
+    deleted['posts'] += posts
+    deleted['comments'] += comments
+    archived, archived_comments, _ = _delete_posts(
+        ArchivedPost.objects.filter(author=user), ArchivedComment,
+        chunk_size)
+    deleted['archived_posts'] += archived
+    deleted['archived_comments'] += archived_comments
+    for model, kind in ((Comment, 'comments'),
+                        (ArchivedComment, 'archived_comments')):
+        for rows in _chunks(model._base_manager.filter(author=user),
+                            ('pk',), chunk_size):
+            deleted[kind] += raw_delete(
+                model._base_manager.filter(pk__in=[pk for pk, in rows]))
+    for field, other in (('user', 'author_id'), ('author', 'user_id')):
+        for rows in _chunks(Follow.objects.filter(**{field: user}),
+                            ('pk', other), chunk_size):
+            deleted['follows'] += raw_delete(
+                Follow.objects.filter(pk__in=[pk for pk, _ in rows]))
+            graph.invalidate(*{user_id for _, user_id in rows})
+    graph.invalidate(user.pk)
+    # оставшиеся связи пусты, сборщику удалять уже нечего
+    user.delete()
+    if archived or archived_comments:
+        archive.invalidate()
+    page_cache.invalidate()
+    _refresh(groups)
+    return deleted
+
+
+def delete_group(group, chunk_size=CHUNK_SIZE):
+    """Deletes a group, its live and archived posts are left without a
+    group chunk by chunk. Returns the number of such posts"""
+    detached = 0
+    for model in (Post, ArchivedPost):
+        for rows in _chunks(model._base_manager.filter(group=group),
+                            ('pk',), chunk_size):
+            detached += model._base_manager.filter(
+                pk__in=[pk for pk, in rows]).update(group=None)
+    group_id = group.pk
+    group.delete()
+    archive.invalidate()
+    group_stats.invalidate(group_id)
+    cache.delete(trending.top_key(group_id))
+    return detached
+
+
+def _mark(queryset, deleted):
+    rows = queryset.filter(is_deleted=not deleted)
+    fields = (('author_id', 'group_id') if rows.model is Post
+              else ('post__author_id', 'post__group_id'))
+    pairs = set(rows.order_by().values_list(*fields).distinct())
+    authors = {author_id for author_id, _ in pairs}
+    groups = {group_id for _, group_id in pairs} - {None}
+    changed = rows.update(is_deleted=deleted,
+                          deleted_at=timezone.now() if deleted else None)
+    if changed:
+        page_cache.invalidate(authors=authors, groups=groups)
+        if rows.model is Post:
+            _refresh(groups)
+    return changed
+
+
+def trash(queryset):
+    """Soft deletes the posts or comments of a queryset with a single
+    UPDATE, returns the number of deleted rows. Comments of a deleted
+    post are hidden with it and keep their own state"""
+    return _mark(queryset, True)
+
+
+def restore(queryset):
+    """Brings back soft deleted posts or comments of an all_objects
+    queryset, returns the number of restored rows"""
+    return _mark(queryset, False)
+
+
+def purge(before, chunk_size=PURGE_CHUNK_SIZE, pause=0):
+    """Hard deletes posts and comments soft deleted before the date,
+    archived comments included, sleeping for pause seconds after every
+    chunk. Returns the numbers of purged posts and comments"""
+    posts, comments, _ = _delete_posts(
+        Post.all_objects.filter(is_deleted=True, deleted_at__lt=before),
+        Comment, chunk_size, pause)
+    for model in (Comment, ArchivedComment):
+        for rows in _chunks(model.all_objects.filter(is_deleted=True,
+                                                     deleted_at__lt=before),
+                            ('pk',), chunk_size):
+            comments += raw_delete(
+                model.all_objects.filter(pk__in=[pk for pk, in rows]))
+            if pause:
+                time.sleep(pause)
+    # удалённые записи уже скрыты, кэши обновлять не нужно
+    return posts, comments
@@ -0,0 +1,133 @@
+"""In-process cache of the follow graph for hot users
+
+Every process keeps its own graph. Follow changes made in the process
+invalidate it at once, changes made by other processes, workers and
+management commands are seen when the cached edges expire after
+FOLLOW_GRAPH_TTL seconds.
+"""
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from threading import Lock
+
+from django.conf import settings
+
+from .models import Follow
+
+
+class FollowGraph:
+    """Keeps sorted arrays of followee and follower ids of recently
+    requested users for ttl seconds, evicting the least recently used
+    ones"""
+
+    def __init__(self, max_users, ttl=None):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = Lock()
+        self._generation = 0
+        # user id -> (expiry time, ids of authors the user follows)
+        self._followees = OrderedDict()
+        # author id -> (expiry time, ids of users following the author)
+        self._followers = OrderedDict()
+
+    def _lookup(self, table, ids):
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in ids:
+                entry = table.get(key)
+                if entry is None:
+                    continue
+                expires, value = entry
+                if expires is not None and expires <= now:
+                    del table[key]
+                    continue
+                table.move_to_end(key)
+                found[key] = value
+            return found, self._generation
+
+    def _store(self, table, values, generation):
+        with self._lock:
+            # the graph was invalidated while loading, the values may be stale
+            if generation != self._generation:
+                return
+            expires = None
+            if self.ttl is not None:
+                expires = time.monotonic() + self.ttl
+            for key, value in values.items():
+                table[key] = expires, value
+                table.move_to_end(key)
+            while len(table) > self.max_users:
+                table.popitem(last=False)
+
+    def _resolve(self, table, key_field, value_field, ids):
+        ids = set(ids)
+        found, generation = self._lookup(table, ids)
+        missing = ids - found.keys()
+        if missing:
+            edges = defaultdict(list)
+            rows = Follow.objects.filter(
+                **{f'{key_field}__in': missing}
+            ).values_list(key_field, value_field)
+            for key, value in rows:
+                edges[key].append(value)
+            loaded = {key: array('l', sorted(edges[key])) for key in missing}
+            self._store(table, loaded, generation)
+            found.update(loaded)
+        return found
+
+    def followees_many(self, user_ids):
+        """Maps every user id to the sorted ids of the authors followed"""
+        return self._resolve(self._followees, 'user_id', 'author_id',
+                             user_ids)
+
+    def followers_many(self, author_ids):
+        """Maps every author id to the sorted ids of the followers"""
+        return self._resolve(self._followers, 'author_id', 'user_id',
+                             author_ids)
+
+    def followees(self, user_id):
+        return self.followees_many([user_id])[user_id]
+
+    def followers(self, author_id):
+        return self.followers_many([author_id])[author_id]
+
+    def is_following(self, user_id, author_id):
+        return self.following_map(user_id, [author_id])[author_id]
+
+    def following_map(self, user_id, author_ids):
+        """Resolves follow state of the user for all given authors at once"""
+        followees = self.followees(user_id)
+        state = {}
+        for author_id in author_ids:
+            index = bisect_left(followees, author_id)
+            state[author_id] = (index < len(followees)
+                                and followees[index] == author_id)
+        return state
+
+    def follower_counts(self, author_ids):
+        return {author_id: len(ids) for author_id, ids
+                in self.followers_many(author_ids).items()}
+
+    def followee_counts(self, user_ids):
+        return {user_id: len(ids) for user_id, ids
+                in self.followees_many(user_ids).items()}
+
+    def invalidate(self, *user_ids):
+        """Drops cached edges of the users, call it after follow changes"""
+        with self._lock:
+            self._generation += 1
+            for user_id in user_ids:
+                self._followees.pop(user_id, None)
+                self._followers.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._followees.clear()
+            self._followers.clear()
+
+
+graph = FollowGraph(settings.FOLLOW_GRAPH_MAX_USERS,
+                    settings.FOLLOW_GRAPH_TTL)
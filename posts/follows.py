@@ -0,0 +1,71 @@
+"""Batched follow and unfollow operations"""
+from collections import defaultdict
+from itertools import islice
+
+from django.db import transaction
+
+from . import page_cache
+from .deletion import raw_delete
+from .follow_graph import graph
+from .models import Follow
+
+CHUNK_SIZE = 500
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _pair_chunks(edges, size):
+    for chunk in chunked(edges, size):
+        yield {(user_id, author_id) for user_id, author_id in chunk
+               if user_id != author_id}
+
+
+def follow_many(edges, chunk_size=CHUNK_SIZE):
+    """Creates follows for (user_id, author_id) pairs, skipping
+    self-follows and existing pairs. Returns the number of created
+    follows"""
+    total = 0
+    for chunk in _pair_chunks(edges, chunk_size):
+        followed = Follow.objects.filter(
+            user_id__in={user_id for user_id, _ in chunk})
+        with transaction.atomic():
+            # пропущенные из-за конфликта строки bulk_create не сообщает
+            before = followed.count()
+            Follow.objects.bulk_create(
+                [Follow(user_id=user_id, author_id=author_id)
+                 for user_id, author_id in chunk],
+                ignore_conflicts=True)
+            created = followed.count() - before
+        if created:
+            users = {user_id for pair in chunk for user_id in pair}
+            graph.invalidate(*users)
+            page_cache.invalidate(authors=users)
+        total += created
+    return total
+
+
+def unfollow_many(edges, chunk_size=CHUNK_SIZE):
+    """Deletes follows for (user_id, author_id) pairs with one delete
+    per follower in a chunk. Returns the number of deleted follows"""
+    total = 0
+    for chunk in _pair_chunks(edges, chunk_size):
+        authors = defaultdict(list)
+        for user_id, author_id in chunk:
+            authors[user_id].append(author_id)
+        with transaction.atomic():
+            for user_id, author_ids in authors.items():
+                follows = Follow.objects.filter(user_id=user_id,
+                                                author_id__in=author_ids)
+                # без сигналов на каждую строку, кэш сбрасывается ниже
+                total += raw_delete(follows)
+        users = {user_id for pair in chunk for user_id in pair}
+        graph.invalidate(*users)
+        page_cache.invalidate(authors=users)
+    return total
@@ -0,0 +1,104 @@
+"""Precomputed group statistics and first pages of group feeds
+
+Stats and feed ids live in the cache for GROUP_STATS_TIMEOUT seconds.
+New posts update them in place, any other change drops the entry so it
+is computed again from the database on the next read. Changes made by
+other processes are seen when the entries expire.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import Group, Post
+
+PAGE_SIZE = 10
+INDEX_KEY = 'groups:index'
+
+
+def stats_key(group_id):
+    return f'groups:stats:{group_id}'
+
+
+def feed_key(group_id):
+    return f'groups:feed:{group_id}'
+
+
+def _compute(group_id):
+    posts = Post.objects.filter(group_id=group_id)
+    authors = dict(posts.order_by().values_list('author_id')
+                   .annotate(count=Count('id')))
+    return {
+        'post_count': sum(authors.values()),
+        'last_post': posts.aggregate(last=Max('pub_date'))['last'],
+        'authors': authors,
+    }
+
+
+def stats_many(group_ids):
+    """Maps group ids to dicts with post_count, last_post and authors,
+    a mapping of author ids to their post counts in the group"""
+    keys = {stats_key(group_id): group_id for group_id in group_ids}
+    found = cache.get_many(keys)
+    result = {keys[key]: value for key, value in found.items()}
+    for key in keys.keys() - found.keys():
+        result[keys[key]] = _compute(keys[key])
+        cache.set(key, result[keys[key]], settings.GROUP_STATS_TIMEOUT)
+    return result
+
+
+def stats(group_id):
+    return stats_many([group_id])[group_id]
+
+
+def first_page_ids(group_id):
+    ids = cache.get(feed_key(group_id))
+    if ids is None:
+        ids = list(Post.objects.filter(group_id=group_id)
+                   .values_list('id', flat=True)[:PAGE_SIZE])
+        cache.set(feed_key(group_id), ids, settings.GROUP_STATS_TIMEOUT)
+    return ids
+
+
+def group_index():
+    """All groups with their stats, ready for the groups page"""
+    groups = cache.get(INDEX_KEY)
+    if groups is None:
+        groups = list(Group.objects.order_by('title')
+                      .values('id', 'title', 'slug', 'description'))
+        cache.set(INDEX_KEY, groups, settings.GROUP_STATS_TIMEOUT)
+    group_stats = stats_many([group['id'] for group in groups])
+    return [{**group, **group_stats[group['id']],
+             'author_count': len(group_stats[group['id']]['authors'])}
+            for group in groups]
+
+
+def record_post(post):
+    """Accounts a new post in the cached stats and feed of its group"""
+    if post.group_id is None:
+        return
+    key = stats_key(post.group_id)
+    group_stats = cache.get(key)
+    if group_stats is not None:
+        authors = group_stats['authors']
+        authors[post.author_id] = authors.get(post.author_id, 0) + 1
+        group_stats['post_count'] += 1
+        last = group_stats['last_post']
+        if last is None or post.pub_date > last:
+            group_stats['last_post'] = post.pub_date
+        cache.set(key, group_stats, settings.GROUP_STATS_TIMEOUT)
+    ids = cache.get(feed_key(post.group_id))
+    if ids is not None:
+        cache.set(feed_key(post.group_id), [post.pk] + ids[:PAGE_SIZE - 1],
+                  settings.GROUP_STATS_TIMEOUT)
+
+
+def invalidate(*group_ids):
+    keys = []
+    for group_id in group_ids:
+        if group_id is not None:
+            keys += [stats_key(group_id), feed_key(group_id)]
+    cache.delete_many(keys)
+
+
+def invalidate_index():
+    cache.delete(INDEX_KEY)
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posts.archive import BATCH_SIZE, archive
+
+
+class Command(BaseCommand):
+    help = ('Moves posts older than ARCHIVE_AFTER_DAYS with their comments '
+            'to the archive tables, run it periodically. Running sites '
+            'show the moves within ARCHIVE_COUNT_TIMEOUT seconds')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.ARCHIVE_AFTER_DAYS,
+                            help='archive posts older than this many days')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='posts moved in one transaction')
+
+    def handle(self, days, batch_size, **options):
+        if days < 0 or batch_size < 1:
+            raise CommandError('--days and --batch-size must be positive')
+        before = timezone.now() - timedelta(days=days)
+        posts, comments = archive(before, batch_size)
+        self.stdout.write(f'Archived {posts} posts and {comments} comments')
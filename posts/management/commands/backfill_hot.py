@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+from posts.follows import chunked
+from posts.models import Post
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = ('Scores posts created before the ranking. Running sites '
+            'rebuild their top-K lists from the stored scores within '
+            'TRENDING_TOP_TIMEOUT seconds')
+
+    def handle(self, **options):
+        # ключи собираются заранее: обновление hot не сдвигает выборку
+        # по индексу, пока она читается
+        ids = list(Post.objects.filter(hot=0).values_list('pk', flat=True))
+        for chunk in chunked(ids, BATCH_SIZE):
+            posts = list(Post.objects.filter(pk__in=chunk)
+                         .only('pk', 'pub_date', 'author_id'))
+            for post in posts:
+                post.hot = trending.post_score(post)
+            Post.objects.bulk_update(posts, ['hot'])
+        self.stdout.write(f'Scored {len(ids)} posts')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.deletion import CHUNK_SIZE, delete_user
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = ('Deletes a user with all their posts, comments and follows '
+            'in chunks, without loading them into memory')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='rows deleted in one transaction')
+
+    def handle(self, username, chunk_size, **options):
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            raise CommandError(f'User {username} does not exist')
+        deleted = delete_user(user, chunk_size)
+        self.stdout.write('Deleted user {} with {}'.format(
+            username, ', '.join(f'{number} {kind.replace("_", " ")}'
+                                for kind, number in deleted.items())))
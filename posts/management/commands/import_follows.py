@@ -0,0 +1,82 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.follows import CHUNK_SIZE, chunked, follow_many, unfollow_many
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = ('Imports follows from an edge list: one '
+            '"<follower> <author>" pair of usernames per line. Running '
+            'sites see the follows within FOLLOW_GRAPH_TTL seconds')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='edge list file, "-" for stdin')
+        parser.add_argument('--unfollow', action='store_true',
+                            help='delete the listed follows instead')
+        parser.add_argument('--ids', action='store_true',
+                            help='edges are user ids, not usernames')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def read_edges(self, lines):
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            pair = line.replace(',', ' ').split()
+            if len(pair) != 2:
+                raise CommandError(f'line {number}: expected two values')
+            yield pair
+
+    def parse_ids(self, edges):
+        for user, author in edges:
+            try:
+                yield int(user), int(author)
+            except ValueError:
+                raise CommandError(
+                    f'expected user ids, got "{user} {author}"')
+
+    def check_ids(self, edges, chunk_size):
+        """Stops at a chunk of edges with ids of missing users"""
+        for chunk in chunked(edges, chunk_size):
+            ids = {user_id for pair in chunk for user_id in pair}
+            unknown = ids - set(User.objects.filter(pk__in=ids)
+                                .values_list('pk', flat=True))
+            if unknown:
+                raise CommandError('unknown user ids: ' +
+                                   ', '.join(map(str, sorted(unknown))))
+            yield from chunk
+
+    def resolve(self, edges, chunk_size):
+        """Maps usernames to ids with one query per chunk of edges"""
+        for chunk in chunked(edges, chunk_size):
+            names = {name for pair in chunk for name in pair}
+            ids = dict(User.objects.filter(username__in=names)
+                       .values_list('username', 'id'))
+            unknown = names - ids.keys()
+            if unknown:
+                self.stderr.write('unknown users: ' +
+                                  ', '.join(sorted(unknown)))
+            for user, author in chunk:
+                if user in ids and author in ids:
+                    yield ids[user], ids[author]
+
+    def handle(self, path, unfollow, ids, chunk_size, **options):
+        try:
+            lines = (sys.stdin if path == '-'
+                     else open(path, encoding='utf-8'))
+        except OSError as error:
+            raise CommandError(f'cannot read {path}: {error.strerror}')
+        with lines:
+            edges = self.read_edges(lines)
+            if ids:
+                edges = self.check_ids(self.parse_ids(edges), chunk_size)
+            else:
+                edges = self.resolve(edges, chunk_size)
+            if unfollow:
+                count = unfollow_many(edges, chunk_size)
+                self.stdout.write(f'Deleted {count} follows')
+            else:
+                count = follow_many(edges, chunk_size)
+                self.stdout.write(f'Imported {count} follows')
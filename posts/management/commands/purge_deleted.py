@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posts.deletion import PURGE_CHUNK_SIZE, purge
+
+
+class Command(BaseCommand):
+    help = ('Deletes posts and comments soft deleted more than '
+            'SOFT_DELETE_GRACE_DAYS ago, run it off-peak')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.SOFT_DELETE_GRACE_DAYS,
+                            help='purge rows deleted more than this many '
+                                 'days ago')
+        parser.add_argument('--batch-size', type=int,
+                            default=PURGE_CHUNK_SIZE,
+                            help='rows deleted in one transaction')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='seconds to wait between batches')
+
+    def handle(self, days, batch_size, pause, **options):
+        if days < 0 or batch_size < 1 or pause < 0:
+            raise CommandError('--days, --batch-size and --pause '
+                               'must be positive')
+        before = timezone.now() - timedelta(days=days)
+        posts, comments = purge(before, batch_size, pause)
+        self.stdout.write(f'Purged {posts} posts and {comments} comments')
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import group_stats, page_cache, seed, trending
+from posts.follow_graph import graph
+from posts.models import Group
+
+
+class Command(BaseCommand):
+    help = ('Fills the database with synthetic users, groups, posts, '
+            'comments and follows for load tests. The same --seed and '
+            '--until give the same data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=30000,
+                            help='approximate number of comments')
+        parser.add_argument('--follows', type=int, default=20000,
+                            help='follows to generate before removing '
+                                 'duplicates')
+        parser.add_argument('--images', type=int, default=0,
+                            help='number of distinct images to attach')
+        parser.add_argument('--image-share', type=float, default=0.2,
+                            help='share of posts with an image')
+        parser.add_argument('--days', type=int, default=30,
+                            help='posts are spread over this many days')
+        parser.add_argument('--until', type=float,
+                            help='timestamp of the newest post, now by '
+                                 'default')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='processes generating the rows')
+        parser.add_argument('--password',
+                            help='password of all users, unusable by '
+                                 'default')
+
+    def handle(self, processes, **options):
+        if options['users'] < 2 and (options['posts'] or options['follows']):
+            raise CommandError('posts and follows need at least two users')
+        if options['days'] <= 0:
+            raise CommandError('--days must be positive')
+        plan = seed.plan(
+            **{name: options[name] for name in [
+                'seed', 'users', 'groups', 'posts', 'comments', 'follows',
+                'images', 'image_share', 'password', 'until', 'days']})
+        created = seed.populate(plan, processes, log=self.stdout.write)
+        # сигналы при bulk_create не отправляются, кэши новых строк
+        # сбрасываются здесь, остальное содержимое кэша не трогается
+        group_ids = list(Group.objects.values_list('id', flat=True))
+        graph.clear()
+        page_cache.invalidate()
+        group_stats.invalidate(*group_ids)
+        group_stats.invalidate_index()
+        trending.rebuild()
+        for group_id in group_ids:
+            trending.rebuild(group_id)
+        self.stdout.write(', '.join(f'{table}: {count}'
+                                    for table, count in created.items()))
@@ -0,0 +1,75 @@
+"""Garbage collection of shared image blobs
+
+A blob may be released while a new post with the same image is being
+saved: the upload finds the blob in place and does not write it, the
+release does not see the uncommitted post yet. release() therefore moves
+a blob away before it checks the references a second time, and keep()
+writes the blob again once the new post is committed.
+"""
+import os
+
+from django.core.exceptions import SuspiciousFileOperation
+
+from .models import ArchivedPost, Post
+
+
+def _storage():
+    return Post._meta.get_field('image').storage
+
+
+def _referenced(names):
+    # удалённые посты ещё можно восстановить вместе с картинками
+    used = set(Post.all_objects.filter(image__in=names)
+               .values_list('image', flat=True))
+    used.update(ArchivedPost.objects.filter(image__in=names)
+                .values_list('image', flat=True))
+    return used
+
+
+def release(*names):
+    """Deletes image blobs no post refers to anymore, with thumbnails"""
+    names = {name for name in names if name}
+    if not names:
+        return []
+    # sorl тянет urllib и парсеры, воркеру они нужны только здесь
+    from sorl.thumbnail import delete
+    from sorl.thumbnail.images import ImageFile
+    storage = _storage()
+    moved = {}
+    for name in sorted(names - _referenced(names)):
+        try:
+            path = storage.path(name)
+        except SuspiciousFileOperation:
+            # путь вне MEDIA_ROOT, это не наш файл
+            continue
+        try:
+            os.replace(path, path + '.released')
+        except FileNotFoundError:
+            moved[name] = None
+        else:
+            moved[name] = path
+    used = _referenced(moved)
+    deleted = []
+    for name, path in moved.items():
+        if name in used:
+            # картинку успели опубликовать снова
+            if path is not None:
+                os.replace(path + '.released', path)
+            continue
+        if path is not None:
+            os.remove(path + '.released')
+        # сам файл уже удалён выше, sorl чистит только миниатюры
+        delete(ImageFile(name, storage=storage), delete_file=False)
+        deleted.append(name)
+    return deleted
+
+
+def keep(name, content):
+    """Writes the blob of a committed post again when a concurrent
+    release has deleted it"""
+    storage = _storage()
+    if storage.exists(name):
+        return
+    content.seek(0)
+    storage.save(Post._meta.get_field('image').generate_filename(
+        None, content.name), content)
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-19 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_archived_comment_soft_delete'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='posts_comme_post_id_944a68_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'is_deleted', 'created'], name='posts_comme_post_id_7fc1a3_idx'),
+        ),
+    ]
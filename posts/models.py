@@ -1,5 +1,9 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+
+from yatube.reverse import cached_reverse
+from yatube.storage import media_storage
 
 User = get_user_model()
 
@@ -13,12 +17,46 @@ class Group(models.Model):
     def __str__(self):
         return self.title
 
+    def get_absolute_url(self):
+        return cached_reverse('group', self.slug)
+
     class Meta:
         verbose_name = 'Группа'
         verbose_name_plural = 'Группы'
 
 
-class Post(models.Model):
+class LiveManager(models.Manager):
+    """Default manager hiding soft deleted rows, all_objects shows them"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
+class PostLinks:
+    """URLs and counters shared by live and archived posts"""
+
+    def get_absolute_url(self):
+        return cached_reverse('post', self.author.username, self.pk)
+
+    @property
+    def author_url(self):
+        return cached_reverse('profile', self.author.username)
+
+    @property
+    def edit_url(self):
+        return cached_reverse('post_edit', self.author.username, self.pk)
+
+    @property
+    def delete_url(self):
+        return cached_reverse('post_delete', self.author.username, self.pk)
+
+    @cached_property
+    def comment_count(self):
+        """Feeds annotate the count, a single post counts on first use"""
+        return self.comments.count()
+
+
+class Post(PostLinks, models.Model):
     """Post model"""
     text = models.TextField('Текст')
     pub_date = models.DateTimeField('Дата публикации',
@@ -31,13 +69,25 @@ class Post(models.Model):
                               blank=True, null=True, related_name='posts',
                               verbose_name='Группа')
     image = models.ImageField(upload_to='posts/', blank=True,
-                              null=True, verbose_name='Картинка')
+                              null=True, verbose_name='Картинка',
+                              storage=media_storage, db_index=True)
+    hot = models.FloatField('Рейтинг', default=0, db_index=True,
+                            editable=False)
+    is_deleted = models.BooleanField('Удалена', default=False,
+                                     editable=False)
+    deleted_at = models.DateTimeField('Дата удаления', blank=True, null=True,
+                                      editable=False)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.text
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [models.Index(fields=['group', 'hot']),
+                   models.Index(fields=['is_deleted', 'pub_date'])]
         verbose_name = 'Публикация'
         verbose_name_plural = 'Публикации'
 
@@ -50,11 +100,20 @@ class Comment(models.Model):
     text = models.TextField('Комментарий', max_length=200)
     created = models.DateTimeField("Дата комментария", auto_now_add=True,
                                    db_index=True)
+    is_deleted = models.BooleanField('Удалён', default=False, editable=False)
+    deleted_at = models.DateTimeField('Дата удаления', blank=True, null=True,
+                                      editable=False)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.text
 
     class Meta:
+        ordering = ('created', 'id')
+        # комментарии поста читаются без удалённых в порядке даты
+        indexes = [models.Index(fields=['post', 'is_deleted', 'created'])]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -71,3 +130,58 @@ class Follow(models.Model):
         unique_together = ("user", "author")
         verbose_name = 'Подписчик'
         verbose_name_plural = 'Подписчики'
+
+
+class ArchivedPost(PostLinks, models.Model):
+    """Post moved out of the live table by the archive_posts command,
+    keeps its id, archived posts are read only"""
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField('Текст')
+    pub_date = models.DateTimeField('Дата публикации', db_index=True)
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='archived_posts',
+                               verbose_name='Автор')
+    group = models.ForeignKey(Group, on_delete=models.SET_NULL,
+                              blank=True, null=True,
+                              related_name='archived_posts',
+                              verbose_name='Группа')
+    image = models.ImageField(upload_to='posts/', blank=True,
+                              null=True, verbose_name='Картинка',
+                              storage=media_storage, db_index=True)
+    hot = models.FloatField('Рейтинг', default=0)
+    archived = models.DateTimeField('Дата архивации', auto_now_add=True)
+
+    def __str__(self):
+        return self.text
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Публикация в архиве'
+        verbose_name_plural = 'Архив публикаций'
+
+
+class ArchivedComment(models.Model):
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(ArchivedPost, on_delete=models.CASCADE,
+                             related_name='comments')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='archived_comments')
+    text = models.TextField('Комментарий', max_length=200)
+    created = models.DateTimeField('Дата комментария', db_index=True)
+    # удалённые комментарии переносятся в архив с отметкой и
+    # дожидаются purge_deleted там
+    is_deleted = models.BooleanField('Удалён', default=False, editable=False)
+    deleted_at = models.DateTimeField('Дата удаления', blank=True, null=True,
+                                      editable=False)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    def __str__(self):
+        return self.text
+
+    class Meta:
+        ordering = ('created', 'id')
+        indexes = [models.Index(fields=['post', 'created'])]
+        verbose_name = 'Комментарий в архиве'
+        verbose_name_plural = 'Архив комментариев'
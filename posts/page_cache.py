@@ -0,0 +1,167 @@
+"""Shared page cache with per-user holes
+
+A cached page is rendered once without any viewer: every personalised
+fragment is left as a hole marker by {% hole %}. Each response, fresh
+or from the cache, fills the holes for its own viewer, so anonymous and
+logged-in users share one cached rendering. Outside cached pages
+{% hole %} renders the fragment right away.
+
+A view marks the authors and groups its page shows with depends_on().
+A change of a post, comment or follow bumps only the versions of its
+author and group, so unrelated pages stay cached under write load;
+changes of users and groups and bulk operations drop all pages.
+
+Versions live in the cache of the process, changes made by other
+processes are seen when the pages expire after PAGE_CACHE_TIMEOUT.
+"""
+import hashlib
+import json
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from .follow_graph import graph
+from .forms import CommentForm
+
+VERSION_KEY = 'pages:version'
+HOLE = re.compile(r'<!--hole:(\w+):(.*?)-->')
+
+holes = {}
+
+
+def hole(name):
+    """Registers a renderer of a personalised fragment. It is called
+    with the request, the viewer and the arguments of the marker"""
+    def register(func):
+        holes[name] = func
+        return func
+    return register
+
+
+@hole('nav')
+def nav(request, user):
+    return render_to_string('nav.html', {'user': user}, request)
+
+
+@hole('menu')
+def menu(request, user, active):
+    return render_to_string('includes/menu.html',
+                            {'user': user, active: True}, request)
+
+
+@hole('follow_button')
+def follow_button(request, user, username, author_id):
+    following = (user is not None and user.is_authenticated
+                 and graph.is_following(user.id, author_id))
+    return render_to_string('includes/follow_button.html', {
+        'user': user, 'username': username, 'following': following,
+    }, request)
+
+
+@hole('comment_form')
+def comment_form(request, user, username, post_id):
+    return render_to_string('includes/comment_form.html', {
+        'user': user, 'username': username, 'post_id': post_id,
+        'form': CommentForm(),
+    }, request)
+
+
+def punch(context, name, *args):
+    """A hole marker while a cached page renders, the fragment otherwise"""
+    request = context.get('request')
+    if getattr(request, 'punch_holes', False):
+        # '>' экранируется, чтобы аргументы не закрыли комментарий
+        args = json.dumps(args).replace('>', '\\u003e')
+        return f'<!--hole:{name}:{args}-->'
+    return holes[name](request, context.get('user'), *args)
+
+
+def fill(request, html):
+    return HOLE.sub(lambda match: holes[match.group(1)](
+        request, request.user, *json.loads(match.group(2))), html)
+
+
+def version(key=VERSION_KEY):
+    # после вытеснения ключа версия начинается с нового значения,
+    # а не с уже использованной единицы
+    return cache.get_or_set(key, time.time_ns, None)
+
+
+def scope_keys(authors=(), groups=()):
+    return ([f'pages:author:{pk}' for pk in authors if pk is not None]
+            + [f'pages:group:{pk}' for pk in groups if pk is not None])
+
+
+def depends_on(request, authors=(), groups=()):
+    """Marks the page being cached as showing posts, comments and
+    follows of the authors and groups"""
+    scopes = getattr(request, 'page_scopes', None)
+    if scopes is not None:
+        # версии читаются до загрузки контента: изменение во время
+        # рендера сделает страницу устаревшей, а не потеряется
+        for key in scope_keys(authors, groups):
+            scopes.setdefault(key, version(key))
+
+
+def invalidate(authors=(), groups=()):
+    """Drops the pages depending on the authors and groups, all
+    versioned pages when none is given"""
+    for key in (scope_keys(authors, groups) if authors or groups
+                else [VERSION_KEY]):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def is_fresh(scopes):
+    if not scopes:
+        return True
+    versions = cache.get_many(scopes)
+    return all(versions.get(key) == value for key, value in scopes.items())
+
+
+def page_key(request, versioned):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'pages:{version() if versioned else 0}:{path}'
+
+
+def cached_page(timeout=None, versioned=True):
+    """Caches the rendering of a view shared by all viewers. Versioned
+    pages live until a change of what they show, the others only
+    expire"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = page_key(request, versioned)
+            page = cache.get(key)
+            if page is not None:
+                content_type, html, scopes = page
+                if not versioned or is_fresh(scopes):
+                    return HttpResponse(fill(request, html),
+                                        content_type=content_type)
+            request.punch_holes = True
+            request.page_scopes = {}
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                request.punch_holes = False
+                scopes, request.page_scopes = request.page_scopes, None
+            if response.streaming:
+                return response
+            html = response.content.decode(response.charset)
+            if response.status_code == 200:
+                cache.set(key, (response['Content-Type'], html, scopes),
+                          settings.PAGE_CACHE_TIMEOUT if timeout is None
+                          else timeout)
+            response.content = fill(request, html)
+            return response
+        return wrapper
+    return decorator
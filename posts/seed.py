@@ -0,0 +1,271 @@
+"""Synthetic data for load tests
+
+Rows are generated in chunks by a pool of processes as dicts of field
+values and saved by the main one with bulk_create. Every chunk has its
+own random generator seeded from the seed, the table and the first row
+of the chunk, so the data depends on the seed only, not on the number
+of processes. Primary keys are assigned here, posts and follows refer
+to users of other chunks without reading them back.
+
+Authorship, follows and comments are Zipfian: a few users write most
+of the posts and have most of the followers, a few posts get most of
+the comments. Comments come in a burst after the post is published
+with a long tail of late ones.
+"""
+import math
+import random
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from itertools import accumulate
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import trending
+from .models import Comment, Follow, Group, Post, User
+
+CHUNK_SIZE = 5000
+ZIPF_EXPONENT = 1.1
+# доля постов в группах
+GROUP_SHARE = 0.7
+# среднее время до комментария во всплеске и доля поздних комментариев
+BURST = 60 * 60
+TAIL = 0.1
+# простое число больше любой таблицы, умножение на него перемешивает ранги
+SCATTER = 2654435761
+GOLDEN = (math.sqrt(5) - 1) / 2
+DAY = 24 * 60 * 60
+WORDS = (
+    'день ночь город дом дорога река море лес поле небо солнце ветер '
+    'дождь снег утро вечер друг книга письмо песня музыка кино кофе чай '
+    'работа отпуск поезд самолёт фото кот собака сад окно мост парк '
+    'новый старый тихий быстрый яркий тёплый холодный долгий первый '
+    'сегодня вчера завтра снова опять наконец почему-то совсем очень'
+).split()
+
+Plan = namedtuple('Plan', [
+    'seed', 'users', 'groups', 'posts', 'comments', 'follows', 'images',
+    'image_share', 'password', 'first_user', 'first_group', 'first_post',
+    'until', 'days',
+])
+
+
+@lru_cache(maxsize=8)
+def zipf_weights(n):
+    """Cumulative weights of ranks 0..n-1, rank 0 is the most frequent"""
+    return list(accumulate(1 / rank ** ZIPF_EXPONENT
+                           for rank in range(1, n + 1)))
+
+
+def zipf(rng, n, k):
+    return rng.choices(range(n), cum_weights=zipf_weights(n), k=k)
+
+
+def rank(index, n):
+    """Popularity rank of a row, spread so popular rows are not all old"""
+    return index * SCATTER % n
+
+
+def post_time(plan, index):
+    """Publication timestamp, posts are evenly spread over the days"""
+    step = plan.days * DAY / plan.posts
+    return (plan.until - plan.days * DAY
+            + step * (index + index * GOLDEN % 1))
+
+
+def moment(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def text(rng, low, high):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high))).capitalize()
+
+
+def comment_delay(rng, age):
+    if rng.random() < TAIL:
+        return rng.uniform(0, age)
+    return min(rng.expovariate(1 / BURST), age)
+
+
+def users(plan, start, count):
+    return range(plan.first_user + start, plan.first_user + start + count)
+
+
+def groups(plan, rng, start, count):
+    return [dict(pk=plan.first_group + i, title=text(rng, 1, 3),
+                 slug=f'seed-{plan.first_group + i}',
+                 description=text(rng, 5, 20))
+            for i in range(start, start + count)]
+
+
+def posts(plan, rng, start, count):
+    """Rows of posts and of their comments, posts are scored the way
+    trending scores them"""
+    authors = zipf(rng, plan.users, count)
+    # ожидаемое число комментариев поста по рангу его популярности
+    total = zipf_weights(plan.posts)[-1]
+    weight = settings.TRENDING_COMMENT_WEIGHT
+    rows, comments = [], []
+    for i, author in zip(range(start, start + count), authors):
+        pk = plan.first_post + i
+        group = None
+        if plan.groups and rng.random() < GROUP_SHARE:
+            group = plan.first_group + zipf(rng, plan.groups, 1)[0]
+        image = ''
+        if plan.images and rng.random() < plan.image_share:
+            image = rng.choice(plan.images)
+        published = post_time(plan, i)
+        pub_date = moment(published)
+        hot = trending.event_score(pub_date, 1)
+        expected = (plan.comments / total
+                    / (rank(i, plan.posts) + 1) ** ZIPF_EXPONENT)
+        number = int(expected) + (rng.random() < expected % 1)
+        for created in sorted(
+                published + comment_delay(rng, plan.until - published)
+                for _ in range(number)):
+            created = moment(created)
+            hot = trending.log_add(hot, trending.event_score(created, weight))
+            comments.append(dict(
+                post_id=pk,
+                author_id=plan.first_user + rng.randrange(plan.users),
+                text=text(rng, 1, 12), created=created))
+        rows.append(dict(pk=pk, text=text(rng, 5, 60), pub_date=pub_date,
+                         author_id=plan.first_user + author,
+                         group_id=group, image=image, hot=hot))
+    return rows, comments
+
+
+def follows(plan, rng, start, count):
+    """Follower in-degrees are Zipfian, follows of a user are unique"""
+    authors = zipf(rng, plan.users, count)
+    pairs = set()
+    for author in authors:
+        user = rng.randrange(plan.users)
+        if user != author:
+            pairs.add((plan.first_user + user, plan.first_user + author))
+    return [dict(user_id=user, author_id=author)
+            for user, author in sorted(pairs)]
+
+
+GENERATORS = {'groups': groups, 'posts': posts, 'follows': follows}
+
+
+def generate(task):
+    kind, plan, start, count = task
+    rng = random.Random(f'{plan.seed}:{kind}:{start}')
+    return GENERATORS[kind](plan, rng, start, count)
+
+
+def tasks(plan, kind, total, chunk_size=CHUNK_SIZE):
+    for start in range(0, total, chunk_size):
+        yield kind, plan, start, min(chunk_size, total - start)
+
+
+def chunks(plan, kind, total, pool=None):
+    """Generated rows of a table, chunk by chunk in order"""
+    if pool is None:
+        return map(generate, tasks(plan, kind, total))
+    return pool.imap(generate, tasks(plan, kind, total))
+
+
+def make_images(seed, count):
+    """Saves count small distinct images, returns their names"""
+    from PIL import Image
+    rng = random.Random(f'{seed}:images')
+    field = Post._meta.get_field('image')
+    names = []
+    for i in range(count):
+        data = BytesIO()
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', (rng.randint(40, 400), rng.randint(40, 400)),
+                  color).save(data, 'PNG')
+        names.append(field.storage.save(
+            field.generate_filename(None, f'seed{i}.png'),
+            ContentFile(data.getvalue())))
+    return names
+
+
+def first_pk(model):
+    # удалённые мягко строки тоже занимают ключи
+    manager = getattr(model, 'all_objects', model.objects)
+    return (manager.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def plan(seed=0, users=1000, groups=20, posts=10000, comments=30000,
+         follows=20000, images=0, image_share=0.2, password=None,
+         until=None, days=30):
+    return Plan(
+        seed=seed, users=users, groups=groups, posts=posts,
+        comments=comments, follows=follows,
+        images=tuple(make_images(seed, images)), image_share=image_share,
+        password=make_password(password),
+        first_user=first_pk(User), first_group=first_pk(Group),
+        first_post=first_pk(Post),
+        until=until if until is not None else timezone.now().timestamp(),
+        days=days,
+    )
+
+
+def create_dated(model, rows, field):
+    """bulk_create of rows with primary keys that keeps their generated
+    dates, auto_now_add overwrites them on insert"""
+    objs = model.all_objects.bulk_create(model(**row) for row in rows)
+    for obj, row in zip(objs, rows):
+        setattr(obj, field, row[field])
+    model.all_objects.bulk_update(objs, [field])
+
+
+def populate(plan, processes=1, log=None):
+    """Generates and saves all rows of the plan, returns the numbers of
+    rows created per table"""
+    created = dict.fromkeys(['users', 'groups', 'posts', 'comments',
+                             'follows'], 0)
+    # дочерние процессы не должны делить соединения с родителем
+    connections.close_all()
+    pool = Pool(processes) if processes > 1 else None
+    try:
+        for _, _, start, count in tasks(plan, 'users', plan.users):
+            User.objects.bulk_create(
+                User(pk=pk, username=f'seed_{pk}', password=plan.password)
+                for pk in users(plan, start, count))
+            created['users'] += count
+        for rows in chunks(plan, 'groups', plan.groups, pool):
+            Group.objects.bulk_create(Group(**row) for row in rows)
+            created['groups'] += len(rows)
+        # ключи комментариев раздаются здесь, число комментариев чанка
+        # известно только после генерации
+        comment_pk = first_pk(Comment)
+        for rows, comments in chunks(plan, 'posts', plan.posts, pool):
+            for comment in comments:
+                comment['pk'] = comment_pk
+                comment_pk += 1
+            with transaction.atomic():
+                create_dated(Post, rows, 'pub_date')
+                create_dated(Comment, comments, 'created')
+            created['posts'] += len(rows)
+            created['comments'] += len(comments)
+            if log:
+                log(f'posts: {created["posts"]} of {plan.posts}')
+        before = Follow.objects.count()
+        for rows in chunks(plan, 'follows', plan.follows, pool):
+            Follow.objects.bulk_create((Follow(**row) for row in rows),
+                                       ignore_conflicts=True)
+        created['follows'] = Follow.objects.count() - before
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    # ключи заданы явно, счётчики последовательностей надо сдвинуть
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Group, Post, Comment]):
+            cursor.execute(sql)
+    return created
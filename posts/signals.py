@@ -0,0 +1,165 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_migrate,
+                                      post_save, pre_save)
+from django.dispatch import receiver
+
+from . import archive, group_stats, media, page_cache, tasks, trending
+from .follow_graph import graph
+from .models import ArchivedPost, Comment, Follow, Group, Post, User
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, raw=False, **kwargs):
+    graph.invalidate(instance.user_id, instance.author_id)
+    if not raw:
+        # счётчики подписок в карточках обоих пользователей
+        page_cache.invalidate(authors=[instance.user_id, instance.author_id])
+
+
+@receiver(post_migrate)
+def database_reset(sender, **kwargs):
+    """Flushing the database makes cached pages, counts and lists stale,
+    group stats expire on their own. Sessions and rate limits are left
+    alone"""
+    graph.clear()
+    page_cache.invalidate()
+    archive.invalidate()
+    group_stats.invalidate_index()
+    trending.invalidate(None)
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, raw=False, **kwargs):
+    """Remembers the stored group and image of an edited post and the
+    uploaded image of the post, scores a new post"""
+    if raw:
+        return
+    if instance.pk is not None:
+        instance._stored_group_id, instance._stored_image = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'image').first() or (None, None))
+    else:
+        instance.hot = trending.post_score(instance)
+    if instance.image and not instance.image._committed:
+        instance._uploaded_image = instance.image.file
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    uploaded = getattr(instance, '_uploaded_image', None)
+    if uploaded is not None:
+        del instance._uploaded_image
+        transaction.on_commit(
+            partial(media.keep, instance.image.name, uploaded))
+    if created:
+        trending.record_post(instance)
+        group_stats.record_post(instance)
+        if instance.image:
+            queue_thumbnails(instance)
+        if (settings.NOTIFY_FOLLOWERS and Follow.objects.filter(
+                author_id=instance.author_id).exists()):
+            tasks.notify_followers.enqueue(
+                instance.pk, key=tasks.notify_key(instance.pk))
+        return
+    stored_group_id = getattr(instance, '_stored_group_id', None)
+    if stored_group_id != instance.group_id:
+        group_stats.invalidate(stored_group_id, instance.group_id)
+        # пост переходит из списка одной группы в список другой
+        trending.invalidate(stored_group_id, instance.group_id)
+    stored_image = getattr(instance, '_stored_image', None)
+    if stored_image != (instance.image.name or None):
+        if instance.image:
+            queue_thumbnails(instance)
+        if stored_image:
+            # задача попадает в ту же транзакцию и видна воркерам
+            # только после её фиксации
+            tasks.release_images.enqueue(stored_image)
+
+
+def queue_thumbnails(post):
+    tasks.make_thumbnails.enqueue(
+        post.pk, key=tasks.thumbnails_key(post.image.name))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    group_stats.invalidate(instance.group_id)
+    trending.invalidate(None, instance.group_id)
+    if instance.image:
+        tasks.release_images.enqueue(instance.image.name)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    group_stats.invalidate_index()
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        trending.record_comment(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        page_cache.invalidate(
+            authors=[instance.author_id],
+            groups=[instance.group_id,
+                    getattr(instance, '_stored_group_id', None)])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # счётчики комментариев видны в карточках профиля и группы
+    post = (Post._base_manager.filter(pk=instance.post_id)
+            .values_list('author_id', 'group_id').first())
+    if post is not None:
+        author_id, group_id = post
+        page_cache.invalidate(authors=[author_id], groups=[group_id])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def content_changed(sender, raw=False, **kwargs):
+    # название группы есть в карточках на всех страницах
+    if not raw:
+        page_cache.invalidate()
+
+
+@receiver(post_delete, sender=ArchivedPost)
+def archived_post_deleted(sender, instance, **kwargs):
+    """Archived posts go away only with their author"""
+    archive.invalidate()
+    page_cache.invalidate(authors=[instance.author_id],
+                          groups=[instance.group_id])
+    if instance.image:
+        tasks.release_images.enqueue(instance.image.name)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, created, update_fields=None, raw=False, **kwargs):
+    # вход обновляет только last_login, страниц это не касается
+    if not (raw or created or update_fields == {'last_login'}):
+        page_cache.invalidate()
+
+
+@receiver(post_save, sender=FlatPage)
+@receiver(post_delete, sender=FlatPage)
+@receiver(m2m_changed, sender=FlatPage.sites.through)
+def flatpage_changed(sender, **kwargs):
+    # модуль со вьюхами грузится только когда страницы правят
+    from yatube import flatpages
+    flatpages.invalidate()
@@ -0,0 +1,80 @@
+"""Background tasks of the posts app"""
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+
+from jobs.models import Job
+from jobs.queue import task
+
+from . import media
+from .models import Follow, Post
+
+
+# SQLite ограничивает число параметров запроса 999
+NOTIFY_CHUNK_SIZE = 500
+
+
+def thumbnails_key(name):
+    # имя картинки — хэш содержимого, миниатюры одного файла
+    # достаточно построить один раз
+    return f'thumbnails:{name}'
+
+
+@task
+def make_thumbnails(post_id):
+    """Renders the card thumbnail before the first feed asks for it"""
+    post = Post.objects.filter(pk=post_id).only('image').first()
+    if post is not None and post.image:
+        # sorl и шаблонные теги грузятся только воркером, который
+        # строит миниатюры
+        from sorl.thumbnail import get_thumbnail
+        from .templatetags.post_cards import (CARD_THUMBNAIL,
+                                              CARD_THUMBNAIL_OPTIONS)
+        get_thumbnail(post.image, CARD_THUMBNAIL, **CARD_THUMBNAIL_OPTIONS)
+
+
+@task
+def release_images(*names):
+    deleted = media.release(*names)
+    # если файл загрузят снова, миниатюры придётся строить заново
+    Job.objects.filter(key__in=[thumbnails_key(name)
+                                for name in deleted]).delete()
+
+
+def notify_key(post_id, after=None):
+    if after is None:
+        return f'notify:{post_id}'
+    return f'notify:{post_id}:{after}'
+
+
+@task
+def notify_followers(post_id, after=0):
+    """Mails followers of the author about a new post. Messages go to
+    the mail queue and are sent by flush_mail in batches. Followers are
+    read from the database: the follow graph of a worker may be stale.
+    A job queues one chunk of followers past the after follow id and
+    the job for the next chunk"""
+    post = Post.objects.select_related('author').filter(pk=post_id).first()
+    if post is None:
+        return
+    author = post.author.username
+    domain = Site.objects.get_current().domain
+    body = (f'{post.text[:500]}\n\n'
+            f'{settings.SITE_SCHEME}://{domain}{post.get_absolute_url()}')
+    rows = list(Follow.objects.filter(author_id=post.author_id, pk__gt=after)
+                .exclude(user__email='').order_by('pk')
+                .values_list('pk', 'user__email')[:NOTIFY_CHUNK_SIZE])
+    if not rows:
+        return
+    last = rows[-1][0]
+    # порция и задача следующей фиксируются вместе: повтор задачи после
+    # сбоя не отправит письма прошлых порций второй раз, а транзакция
+    # не держит блокировку SQLite на всю рассылку
+    with transaction.atomic(), get_connection() as connection:
+        connection.send_messages([
+            EmailMessage(f'Новая запись автора {author}', body, to=[email])
+            for _, email in rows])
+        if len(rows) == NOTIFY_CHUNK_SIZE:
+            notify_followers.enqueue(post_id, last,
+                                     key=notify_key(post_id, last))
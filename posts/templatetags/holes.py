@@ -0,0 +1,13 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..page_cache import punch
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, *args):
+    """{% hole "name" args %} renders a personalised fragment, on cached
+    pages it is filled in for every viewer"""
+    return mark_safe(punch(context, name, *args))
@@ -0,0 +1,138 @@
+"""Post cards of the feeds
+
+{% post_card post %} renders includes/post_card.html. With
+FAST_POST_CARDS it builds the same markup in Python instead, without
+walking the template nodes for every card of a page.
+"""
+import logging
+
+from django import template
+from django.conf import settings
+from django.template.base import render_value_in_context
+from django.template.defaultfilters import date, linebreaksbr
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+from django.utils.timezone import template_localtime
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from yatube.reverse import cached_reverse
+from ..page_cache import hole, punch
+
+logger = logging.getLogger(__name__)
+register = template.Library()
+
+CARD_TEMPLATE = 'includes/post_card.html'
+# те же параметры, что у тега thumbnail в includes/post_card.html
+CARD_THUMBNAIL = '960x339'
+CARD_THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+DATE_FORMAT = 'd M Y г. h:m'
+
+# разметка повторяет шаблон символ в символ, включая пробелы
+# вокруг тегов, см. TestPostCardRenderer
+CARD = (
+    '<div class="card mb-3 mt-1 shadow-sm">\n    \n    {image}\n'
+    '     <div class="card-body">\n'
+    '         <p class="card-text">\n'
+    '         <a name="post_{id}" href="{profile_url}"><strong class="d-block'
+    ' text-gray-dark">@{username}</strong></a>\n'
+    '         {text}\n'
+    '         </p>\n\n'
+    '     {group}\n\n'
+    '     <div class="d-flex justify-content-between align-items-center">\n'
+    '            <div class="btn-group ">\n'
+    '                <a class="btn btn-sm text-muted" href="{post_url}"'
+    ' role="button">\n'
+    '                    {comments}\n'
+    '                </a>\n'
+    '            {owner}\n'
+    '          </div>\n'
+    '         <small class="text-muted">{date}</small>\n'
+    '     </div>\n'
+    '     </div>\n'
+    '</div>'
+)
+IMAGE = '\n        <img class="card-img" src="{url}">\n    '
+GROUP = (
+    '\n        <a class="card-link muted" href="{url}">\n'
+    '                <strong class="d-block text-gray-dark">'
+    '#{title}</strong>\n'
+    '        </a>\n     '
+)
+COMMENTS = '\n                    {count} комментариев\n                    '
+NO_COMMENTS = ('\n                    Добавить комментарий'
+               '\n                    ')
+OWNER = (
+    '\n                 <a class="btn btn-sm text-muted" href="{edit_url}"\n'
+    '                        role="button">\n'
+    '                        Редактировать\n'
+    '                </a>\n'
+    '                 \n'
+    '                <a class="btn btn-sm text-muted" href="{delete_url}"\n'
+    '                        role="button">\n'
+    '                        Удалить\n'
+    '                </a>\n'
+    '                '
+)
+
+
+def _thumbnail_url(post):
+    if not post.image:
+        return None
+    try:
+        return get_thumbnail(post.image, CARD_THUMBNAIL,
+                             **CARD_THUMBNAIL_OPTIONS).url
+    except Exception:
+        # как и тег thumbnail, без THUMBNAIL_DEBUG карточка без картинки
+        if sorl_settings.THUMBNAIL_DEBUG:
+            raise
+        logger.exception('Thumbnail tag failed')
+        return None
+
+
+@hole('post_owner')
+def post_owner(request, user, author_id, username, post_id):
+    """Edit and delete buttons, only the author of the post sees them"""
+    if getattr(user, 'pk', None) != author_id:
+        return ''
+    return OWNER.format(
+        edit_url=conditional_escape(
+            cached_reverse('post_edit', username, post_id)),
+        delete_url=conditional_escape(
+            cached_reverse('post_delete', username, post_id)))
+
+
+def render_card(context, post):
+    """Markup of includes/post_card.html for the post"""
+    def value(obj):
+        return render_value_in_context(obj, context)
+
+    username = post.author.username
+    image = _thumbnail_url(post)
+    group = post.group
+    count = post.comment_count
+    return mark_safe(CARD.format(
+        image=IMAGE.format(url=value(image)) if image else '',
+        id=value(post.id),
+        profile_url=value(post.author_url),
+        username=value(username),
+        text=value(linebreaksbr(post.text, autoescape=context.autoescape)),
+        group=GROUP.format(url=value(group.get_absolute_url()),
+                           title=value(group.title)) if group else '',
+        post_url=value(post.get_absolute_url()),
+        comments=COMMENTS.format(count=value(count)) if count
+        else NO_COMMENTS,
+        owner=punch(context, 'post_owner', post.author_id, username,
+                    post.id),
+        date=value(date(template_localtime(post.pub_date, context.use_tz),
+                        DATE_FORMAT)),
+    ))
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    if settings.FAST_POST_CARDS:
+        return render_card(context, post)
+    card = context.template.engine.get_template(CARD_TEMPLATE)
+    with context.push(post=post):
+        return card.render(context)
@@ -1,13 +1,54 @@
+import datetime
+import gzip
+import os
+import shutil
+import subprocess
+import sys
 import tempfile
-from django.test import TestCase, Client
-from django.urls import reverse
+import time
+from io import BytesIO, StringIO
+from multiprocessing import Pool
+from unittest import mock
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import (TestCase, TransactionTestCase, Client,
+                         RequestFactory, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, models
+from django.urls import path, reverse, set_script_prefix
+from django.contrib.flatpages.models import FlatPage
+from django.core import mail
 from django.core.cache import cache
-from posts.models import Comment, Follow, Group, Post, User
+from django.template import engines
+from django.utils import timezone
+from jobs.models import Job
+from jobs.queue import run_pending
+from posts import (archive, context_processors, deletion, group_stats,
+                   media, page_cache, seed, signals, tasks, trending, views)
+from posts.follow_graph import FollowGraph, graph
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Follow,
+                          Group, Post, User)
 from PIL import Image
+from yatube import ratelimit
+from yatube.reverse import cached_reverse
+from yatube.serve import serve_media, serve_static
+from yatube.storage import (CompressedManifestStaticFilesStorage,
+                            ContentAddressedStorage)
+from yatube.template_profile import profile
+
+# дата старше срока архивации и окна чистки удалённых записей
+OLD_DATE = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+# другой URLconf для проверки кэша reverse
+urlpatterns = [
+    path('people/<str:username>/', views.profile, name='profile'),
+]
 
 
 class PostsTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(username='Conor')
 
@@ -270,3 +311,1404 @@ class TestImg(TestCase):
         error = ('Загрузите правильное изображение. Файл, который вы '
                  'загрузили, поврежден или не является изображением.')
         self.assertFormError(wrong_img, 'form', 'image', error)
+
+
+@override_settings(COMMENTS_PER_PAGE=10)
+class TestCommentPagination(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='commentator')
+        cls.post = Post.objects.create(text='Thread', author=cls.user)
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'comment {i}')
+            for i in range(25))
+        cls.comments = list(Comment.objects.filter(post=cls.post))
+        cls.post_url = reverse('post', kwargs={'username': cls.user.username,
+                                               'post_id': cls.post.id})
+        cls.more_url = reverse('post_comments',
+                               kwargs={'username': cls.user.username,
+                                       'post_id': cls.post.id})
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_first_page(self):
+        response = self.client.get(self.post_url)
+        self.assertEqual(list(response.context['comments']),
+                         self.comments[:10])
+        self.assertEqual(response.context['next_cursor'],
+                         self.comments[9].pk)
+        self.assertContains(response, f'{self.more_url}?after=')
+
+    def test_load_more(self):
+        response = self.client.get(self.more_url,
+                                   {'after': self.comments[9].pk})
+        self.assertEqual(list(response.context['comments']),
+                         self.comments[10:20])
+        response = self.client.get(self.more_url,
+                                   {'after': self.comments[19].pk})
+        self.assertEqual(list(response.context['comments']),
+                         self.comments[20:])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_bad_cursor(self):
+        for after in ('99999999999999999999999', '-1', 'abc'):
+            response = self.client.get(self.more_url, {'after': after})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context['comments']),
+                             self.comments[:10])
+
+    def test_deleted_cursor(self):
+        cursor = Comment.objects.create(post=self.post, author=self.user,
+                                        text='gone')
+        Comment.objects.filter(pk=cursor.pk).delete()
+        response = self.client.get(self.more_url, {'after': cursor.pk})
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(COMMENTS_PER_PAGE=25)
+    def test_full_last_page(self):
+        response = self.client.get(self.post_url)
+        self.assertEqual(len(response.context['comments']), 25)
+        self.assertIsNone(response.context['next_cursor'])
+
+    @override_settings(COMMENTS_LAZY_LOAD=True)
+    def test_lazy_first_render(self):
+        response = self.client.get(self.post_url)
+        self.assertEqual(len(response.context['comments']), 0)
+        self.assertContains(response, 'Показать комментарии (25)')
+        self.assertNotContains(response, 'comment 0')
+
+
+class TestFollowGraph(TestCase):
+    def setUp(self):
+        graph.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.authors = [User.objects.create_user(username=f'author{i}')
+                        for i in range(3)]
+        for author in self.authors[:2]:
+            Follow.objects.create(user=self.reader, author=author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_batch_lookups(self):
+        ids = [author.id for author in self.authors]
+        with self.assertNumQueries(1):
+            state = graph.following_map(self.reader.id, ids)
+        self.assertEqual(state, {ids[0]: True, ids[1]: True, ids[2]: False})
+        with self.assertNumQueries(1):
+            counts = graph.follower_counts(ids)
+        self.assertEqual(counts, {ids[0]: 1, ids[1]: 1, ids[2]: 0})
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(self.reader.id, ids[0]))
+            self.assertEqual(list(graph.followers(ids[1])), [self.reader.id])
+            self.assertEqual(graph.followee_counts([self.reader.id]),
+                             {self.reader.id: 2})
+
+    def test_invalidated_on_follow_and_unfollow(self):
+        author = self.authors[2]
+        self.assertFalse(graph.is_following(self.reader.id, author.id))
+        self.client.get(reverse('profile_follow',
+                                kwargs={'username': author.username}))
+        self.assertTrue(graph.is_following(self.reader.id, author.id))
+        self.assertEqual(graph.follower_counts([author.id])[author.id], 1)
+        self.client.get(reverse('profile_unfollow',
+                                kwargs={'username': author.username}))
+        self.assertFalse(graph.is_following(self.reader.id, author.id))
+        self.assertEqual(graph.follower_counts([author.id])[author.id], 0)
+
+    def test_lru_eviction(self):
+        small_graph = FollowGraph(max_users=2)
+        small_graph.followees(self.reader.id)
+        small_graph.followees(self.authors[0].id)
+        small_graph.followees(self.reader.id)
+        small_graph.followees(self.authors[1].id)
+        with self.assertNumQueries(0):
+            small_graph.followees(self.reader.id)
+        with self.assertNumQueries(1):
+            small_graph.followees(self.authors[0].id)
+
+    def test_entries_expire(self):
+        short_graph = FollowGraph(max_users=10, ttl=60)
+        self.assertEqual(short_graph.followee_counts([self.reader.id]),
+                         {self.reader.id: 2})
+        # подписка из другого процесса не вызывает сигналов этого
+        Follow.objects.bulk_create(
+            [Follow(user=self.reader, author=self.authors[2])])
+        with self.assertNumQueries(0):
+            self.assertEqual(short_graph.followee_counts([self.reader.id]),
+                             {self.reader.id: 2})
+        expired = time.monotonic() + 61
+        with mock.patch('posts.follow_graph.time.monotonic',
+                        return_value=expired):
+            self.assertEqual(short_graph.followee_counts([self.reader.id]),
+                             {self.reader.id: 3})
+
+
+class TestBulkFollow(TestCase):
+    def setUp(self):
+        cache.clear()
+        graph.clear()
+        self.reader = User.objects.create_user(username='onboarding')
+        self.authors = [User.objects.create_user(username=f'writer{i}')
+                        for i in range(5)]
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_bulk_endpoint(self):
+        names = [author.username for author in self.authors]
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        self.assertEqual(graph.followee_counts([self.reader.id]),
+                         {self.reader.id: 1})
+        response = self.client.post(
+            reverse('follow_bulk'),
+            {'author': names + [self.reader.username, 'nobody']})
+        self.assertRedirects(response, reverse('follow_index'))
+        self.assertEqual(self.reader.follower.count(), 5)
+        self.assertEqual(graph.followee_counts([self.reader.id]),
+                         {self.reader.id: 5})
+        self.client.post(reverse('follow_bulk'),
+                         {'author': names[:3], 'action': 'unfollow'})
+        self.assertEqual(
+            set(self.reader.follower.values_list('author__username',
+                                                 flat=True)),
+            set(names[3:]))
+        self.assertEqual(graph.followee_counts([self.reader.id]),
+                         {self.reader.id: 2})
+
+    def test_bulk_endpoint_requires_post(self):
+        response = self.client.get(reverse('follow_bulk'))
+        self.assertEqual(response.status_code, 405)
+
+    @override_settings(FOLLOW_BULK_MAX_AUTHORS=4, RATE_LIMITS={
+        'follow': {'user': (1 / 60, 6), 'ip': (1, 100)}})
+    def test_bulk_endpoint_limits(self):
+        names = [author.username for author in self.authors]
+        response = self.client.post(reverse('follow_bulk'),
+                                    {'author': names})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Follow.objects.exists())
+        # каждый автор берёт токен, длинный список берёт не больше предела
+        response = self.client.post(reverse('follow_bulk'),
+                                    {'author': names[:2]})
+        self.assertRedirects(response, reverse('follow_index'))
+        response = self.client.post(reverse('follow_bulk'),
+                                    {'author': names[2:]})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(Follow.objects.count(), 2)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as edges:
+            edges.write('# follower author\n')
+            for author in self.authors:
+                edges.write(f'{self.reader.username} {author.username}\n')
+            edges.write(f'{self.authors[0].username},{self.authors[1]}\n')
+            edges.flush()
+            out = StringIO()
+            call_command('import_follows', edges.name, '--chunk-size=2',
+                         stdout=out)
+            self.assertEqual(Follow.objects.count(), 6)
+            self.assertIn('Imported 6 follows', out.getvalue())
+            # повторный импорт ничего не создаёт
+            call_command('import_follows', edges.name, stdout=out)
+            self.assertIn('Imported 0 follows', out.getvalue())
+            call_command('import_follows', edges.name, '--unfollow',
+                         stdout=StringIO())
+        self.assertEqual(Follow.objects.count(), 0)
+
+    def test_import_command_errors(self):
+        with self.assertRaisesMessage(CommandError, 'cannot read'):
+            call_command('import_follows', '/nonexistent/edges.txt')
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as edges:
+            edges.write(f'{self.reader.id} {self.authors[0].username}\n')
+            edges.flush()
+            with self.assertRaisesMessage(CommandError, 'expected user ids'):
+                call_command('import_follows', edges.name, '--ids')
+            edges.seek(0)
+            edges.truncate()
+            edges.write(f'{self.reader.id} 999999\n')
+            edges.flush()
+            with self.assertRaisesMessage(CommandError,
+                                          'unknown user ids: 999999'):
+                call_command('import_follows', edges.name, '--ids')
+        self.assertFalse(Follow.objects.exists())
+
+
+@override_settings(TRENDING_TOP_K=3)
+class TestTrending(TestCase):
+    def setUp(self):
+        cache.clear()
+        graph.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='trendsetter')
+        self.group = Group.objects.create(title='Hot', slug='hot')
+        self.posts = [Post.objects.create(text=f'hot post {i}',
+                                          author=self.user,
+                                          group=self.group if i % 2 else None)
+                      for i in range(5)]
+
+    def comment(self, post, count=1):
+        for _ in range(count):
+            Comment.objects.create(post=post, author=self.user, text='+1')
+
+    def test_comments_raise_score(self):
+        old = self.posts[0]
+        score = Post.objects.get(pk=old.pk).hot
+        self.comment(old, 3)
+        self.assertGreater(Post.objects.get(pk=old.pk).hot, score)
+        self.assertEqual(trending.top_post_ids()[0], old.pk)
+        self.assertEqual(len(trending.top_post_ids()), 3)
+
+    def test_top_lists_are_cached(self):
+        trending.top_post_ids()
+        trending.top_post_ids(self.group.id)
+        self.comment(self.posts[1], 3)
+        with self.assertNumQueries(0):
+            top = trending.top_post_ids()
+            group_top = trending.top_post_ids(self.group.id)
+        self.assertEqual(top[0], self.posts[1].pk)
+        self.assertEqual(group_top, [self.posts[1].pk, self.posts[3].pk])
+
+    def test_popular_page(self):
+        self.comment(self.posts[2], 2)
+        response = self.client.get(reverse('popular'))
+        self.assertEqual(response.context['page'][0], self.posts[2])
+        response = self.client.get(reverse('group_popular',
+                                           kwargs={'slug': self.group.slug}))
+        self.assertEqual(len(response.context['page']), 2)
+
+    def test_deleted_post_dropped(self):
+        trending.top_post_ids()
+        Post.objects.filter(pk=self.posts[4].pk).delete()
+        self.assertNotIn(self.posts[4].pk, trending.top_post_ids())
+        self.assertEqual(len(trending.top_post_ids()), 3)
+
+    def test_group_change_moves_post(self):
+        other = Group.objects.create(title='Cold', slug='cold')
+        self.assertIn(self.posts[3].pk, trending.top_post_ids(self.group.id))
+        self.assertEqual(trending.top_post_ids(other.id), [])
+        post = self.posts[3]
+        post.group = other
+        post.save()
+        self.assertNotIn(post.pk, trending.top_post_ids(self.group.id))
+        self.assertEqual(trending.top_post_ids(other.id), [post.pk])
+
+    def test_lists_expire(self):
+        trending.top_post_ids()
+        # очки из другого процесса не обновляют список этого
+        Post.objects.filter(pk=self.posts[0].pk).update(hot=10 ** 6)
+        self.assertNotEqual(trending.top_post_ids()[0], self.posts[0].pk)
+        expired = time.time() + settings.TRENDING_TOP_TIMEOUT + 1
+        with mock.patch('time.time', return_value=expired):
+            self.assertEqual(trending.top_post_ids()[0], self.posts[0].pk)
+
+    def test_new_post_scored_on_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            post = Post.objects.create(text='fresh', author=self.user)
+        self.assertFalse([q for q in queries.captured_queries
+                          if q['sql'].startswith('UPDATE "posts_post"')])
+        self.assertGreater(Post.objects.get(pk=post.pk).hot, 0)
+        self.assertEqual(trending.top_post_ids()[0], post.pk)
+
+    def test_backfill_command(self):
+        Post.objects.filter(pk=self.posts[0].pk).update(hot=0)
+        out = StringIO()
+        call_command('backfill_hot', stdout=out)
+        self.assertIn('Scored 1 posts', out.getvalue())
+        self.assertGreater(Post.objects.get(pk=self.posts[0].pk).hot, 0)
+
+
+class TestGroupStats(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'member{i}')
+                     for i in range(2)]
+        cls.group = Group.objects.create(title='Stats', slug='stats')
+        cls.other = Group.objects.create(title='Other', slug='other')
+        for i in range(12):
+            Post.objects.create(text=f'group post {i}', group=cls.group,
+                                author=cls.users[i % 2])
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_stats_kept_incrementally(self):
+        stats = group_stats.stats(self.group.id)
+        group_stats.first_page_ids(self.group.id)
+        self.assertEqual(stats['post_count'], 12)
+        self.assertEqual(len(stats['authors']), 2)
+        author = User.objects.create_user(username='newcomer')
+        post = Post.objects.create(text='fresh', group=self.group,
+                                   author=author)
+        with self.assertNumQueries(0):
+            stats = group_stats.stats(self.group.id)
+            ids = group_stats.first_page_ids(self.group.id)
+        self.assertEqual(stats['post_count'], 13)
+        self.assertEqual(len(stats['authors']), 3)
+        self.assertEqual(stats['last_post'], post.pub_date)
+        self.assertEqual(ids[0], post.pk)
+        self.assertEqual(len(ids), group_stats.PAGE_SIZE)
+
+    def test_stats_expire(self):
+        group_stats.stats(self.group.id)
+        # пост из другого процесса не обновляет кэш этого
+        Post.objects.bulk_create([Post(text='elsewhere', group=self.group,
+                                       author=self.users[0])])
+        self.assertEqual(group_stats.stats(self.group.id)['post_count'], 12)
+        expired = time.time() + settings.GROUP_STATS_TIMEOUT + 1
+        with mock.patch('time.time', return_value=expired):
+            self.assertEqual(
+                group_stats.stats(self.group.id)['post_count'], 13)
+
+    def test_database_reset_is_targeted(self):
+        # сессии и корзины лимитов переживают сброс базы
+        cache.set('ratelimit:probe', 1)
+        group_stats.group_index()
+        signals.database_reset(sender=None)
+        self.assertEqual(cache.get('ratelimit:probe'), 1)
+        with self.assertNumQueries(1):
+            group_stats.group_index()
+
+    def test_moving_post_updates_both_groups(self):
+        group_stats.stats(self.other.id)
+        post = Post.objects.filter(group=self.group).first()
+        post.group = self.other
+        post.save()
+        self.assertEqual(group_stats.stats(self.group.id)['post_count'], 11)
+        self.assertEqual(group_stats.stats(self.other.id)['post_count'], 1)
+        post.delete()
+        self.assertEqual(group_stats.stats(self.other.id)['post_count'], 0)
+
+    def test_group_page_first_page(self):
+        url = reverse('group', kwargs={'slug': self.group.slug})
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        # страница заново: группа, посты первой страницы одним in_bulk
+        # и их комментарии
+        page_cache.invalidate()
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.context['paginator'].num_pages, 2)
+        self.assertEqual(list(response.context['page']),
+                         list(Post.objects.filter(group=self.group)[:10]))
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(len(response.context['page']), 2)
+
+    def test_groups_page(self):
+        self.client.get(reverse('groups'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('groups'))
+        groups = {group['slug']: group for group in response.context['groups']}
+        self.assertEqual(groups['stats']['post_count'], 12)
+        self.assertEqual(groups['stats']['author_count'], 2)
+        self.assertEqual(groups['other']['post_count'], 0)
+        Group.objects.create(title='Third', slug='third')
+        response = self.client.get(reverse('groups'))
+        self.assertEqual(len(response.context['groups']), 3)
+
+
+class TestStaticServing(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.css = 'body { color: black; }\n' * 50
+        with open(os.path.join(self.root, 'site.css'), 'w') as css:
+            css.write(self.css)
+        self.storage = CompressedManifestStaticFilesStorage(
+            location=self.root)
+        paths = {'site.css': (self.storage, 'site.css')}
+        list(self.storage.post_process(paths))
+        self.hashed = self.storage.hashed_files['site.css']
+        self.factory = RequestFactory()
+
+    def get(self, path, **headers):
+        with override_settings(STATIC_ROOT=self.root):
+            return serve_static(self.factory.get('/static/' + path,
+                                                 **headers), path)
+
+    def test_compressed_copies(self):
+        with open(os.path.join(self.root, self.hashed + '.gz'), 'rb') as gz:
+            self.assertEqual(gzip.decompress(gz.read()).decode(), self.css)
+
+    def test_serves_compressed_hashed_file(self):
+        response = self.get(self.hashed, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)).decode(),
+            self.css)
+        response.close()
+
+    def test_plain_and_conditional(self):
+        response = self.get('site.css')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        response.close()
+        response = self.get('site.css', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_and_outside_files(self):
+        from django.http import Http404
+        for name in ('missing.css', '../etc/passwd'):
+            with self.subTest(name=name):
+                with self.assertRaises(Http404):
+                    self.get(name)
+
+    def test_encoding_q_values(self):
+        cases = {'gzip;q=0, br': None, 'GZIP; q=0.5': 'gzip',
+                 '*': 'gzip', '*, gzip;q=0': None, 'identity': None,
+                 'x-gzip-like': None}
+        for header, encoding in cases.items():
+            with self.subTest(header=header):
+                response = self.get(self.hashed, HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                response.close()
+
+
+class TestMediaServing(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.root, 'posts'))
+        self.data = bytes(range(256)) * 4
+        with open(os.path.join(self.root, 'posts', 'photo.png'), 'wb') as f:
+            f.write(self.data)
+        self.factory = RequestFactory()
+
+    def get(self, **headers):
+        with override_settings(MEDIA_ROOT=self.root):
+            response = serve_media(
+                self.factory.get('/media/posts/photo.png', **headers),
+                'posts/photo.png')
+        self.addCleanup(response.close)
+        return response
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(self.content(response), self.data)
+
+    def test_ranges(self):
+        cases = {
+            'bytes=0-99': (self.data[:100], 'bytes 0-99/1024'),
+            'bytes=1000-': (self.data[1000:], 'bytes 1000-1023/1024'),
+            'bytes=-24': (self.data[-24:], 'bytes 1000-1023/1024'),
+        }
+        for header, (data, content_range) in cases.items():
+            with self.subTest(header=header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(self.content(response), data)
+        response = self.get(HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_conditional_requests(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # устаревший If-Range отдаёт файл целиком
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+
+class TestContentAddressedMedia(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='photographer')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def png(self, color):
+        data = BytesIO()
+        Image.new('RGB', (20, 20), color).save(data, 'PNG')
+        return SimpleUploadedFile(f'{color}.png', data.getvalue(),
+                                  content_type='image/png')
+
+    def publish(self, color):
+        self.client.post(reverse('new_post'),
+                         {'text': 'square', 'image': self.png(color)})
+        return Post.objects.latest('id')
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.root, name))
+
+    def test_same_image_stored_once(self):
+        first, second = self.publish('red'), self.publish('red')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name,
+                         r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(first.image.path))), 1)
+        self.assertEqual(
+            Job.objects.filter(name=tasks.make_thumbnails.task_name).count(),
+            1)
+        first.delete()
+        run_pending()
+        self.assertTrue(self.exists(second.image.name))
+        second.delete()
+        self.assertTrue(self.exists(second.image.name))
+        run_pending()
+        self.assertFalse(self.exists(second.image.name))
+
+    def test_replaced_image_collected(self):
+        post = self.publish('red')
+        old_name = post.image.name
+        self.client.post(
+            reverse('post_edit', kwargs={'username': self.user.username,
+                                         'post_id': post.id}),
+            {'text': 'blue now', 'image': self.png('blue')})
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, old_name)
+        run_pending()
+        self.assertTrue(self.exists(post.image.name))
+        self.assertFalse(self.exists(old_name))
+
+    def test_release_rechecks_references(self):
+        post = self.publish('red')
+        # пост с той же картинкой появляется между двумя проверками
+        with mock.patch.object(media, '_referenced',
+                               side_effect=[set(), {post.image.name}]):
+            self.assertEqual(media.release(post.image.name), [])
+        self.assertTrue(self.exists(post.image.name))
+        self.assertEqual(os.listdir(os.path.dirname(post.image.path)),
+                         [os.path.basename(post.image.name)])
+
+    def test_upload_restores_released_blob(self):
+        save = ContentAddressedStorage._save
+        released = []
+
+        def racing_save(storage, name, content):
+            name = save(storage, name, content)
+            if not released:
+                # освобождение удаляет файл, пока пост ещё не зафиксирован
+                released.append(name)
+                os.remove(storage.path(name))
+            return name
+
+        with mock.patch.object(ContentAddressedStorage, '_save',
+                               racing_save):
+            post = self.publish('red')
+        self.assertEqual(released, [post.image.name])
+        self.assertTrue(self.exists(post.image.name))
+
+    def test_deleted_post_image_collected(self):
+        post = self.publish('green')
+        self.client.get(reverse('post_delete',
+                                args=[self.user.username, post.id]))
+        self.assertFalse(Post.objects.exists())
+        run_pending()
+        # пост можно восстановить, картинка остаётся до чистки
+        self.assertTrue(self.exists(post.image.name))
+        call_command('purge_deleted', days=0, pause=0, stdout=StringIO())
+        self.assertFalse(Post.all_objects.exists())
+        run_pending()
+        self.assertFalse(self.exists(post.image.name))
+
+
+class TestTemplateProfile(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='painter')
+        for i in range(3):
+            Post.objects.create(text=f'canvas {i}', author=self.user)
+
+    @override_settings(FAST_POST_CARDS=False)
+    def test_includes_counted(self):
+        with profile() as stats:
+            self.client.get(reverse('index'))
+        calls, total, own = stats.rows['includes/post_card.html']
+        self.assertEqual(calls, 3)
+        self.assertGreaterEqual(total, own)
+        index = stats.rows['index.html']
+        self.assertEqual(index[0], 1)
+        # своё время страницы не включает время карточек
+        self.assertGreaterEqual(index[1], index[2] + total)
+
+    def test_server_timing_header(self):
+        middleware = settings.MIDDLEWARE + [
+            'yatube.template_profile.TemplateProfileMiddleware']
+        with override_settings(MIDDLEWARE=middleware,
+                               FAST_POST_CARDS=False):
+            response = self.client.get(reverse('index'))
+        self.assertIn('desc="includes/post_card.html"',
+                      response['Server-Timing'])
+
+
+class TestPostCardRenderer(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = User.objects.create_user(username='scribe.o+k')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='<b>Tom & Jerry</b>',
+                                          slug='tom-jerry')
+        image = BytesIO()
+        Image.new('RGB', (40, 20), 'green').save(image, 'PNG')
+        self.posts = [
+            Post.objects.create(text='plain', author=self.author),
+            Post.objects.create(text='<script>x</script>\nline & more',
+                                author=self.author, group=self.group),
+            Post.objects.create(
+                text='picture', author=self.author,
+                image=SimpleUploadedFile('p.png', image.getvalue(),
+                                         content_type='image/png')),
+        ]
+        Comment.objects.create(post=self.posts[1], author=self.reader,
+                               text='hi')
+        self.card = engines['django'].from_string(
+            '{% load post_cards %}{% post_card post %}')
+
+    def render(self, post, user, fast):
+        post = Post.objects.get(pk=post.pk)
+        with override_settings(FAST_POST_CARDS=fast):
+            return self.card.render({'post': post, 'user': user})
+
+    def test_same_markup_as_template(self):
+        for post in self.posts:
+            for user in (self.author, self.reader, None):
+                with self.subTest(post=post.text, user=user):
+                    expected = self.render(post, user, fast=False)
+                    self.assertEqual(self.render(post, user, fast=True),
+                                     expected)
+        self.assertIn('&lt;script&gt;x&lt;/script&gt;<br>line &amp; more',
+                      self.render(self.posts[1], None, fast=True))
+        self.assertIn('<img class="card-img"',
+                      self.render(self.posts[2], None, fast=True))
+
+    def test_same_page(self):
+        self.client.force_login(self.author)
+        pages = []
+        for fast in (False, True):
+            cache.clear()
+            with override_settings(FAST_POST_CARDS=fast):
+                pages.append(self.client.get(reverse('index')).content)
+        self.assertEqual(pages[0], pages[1])
+        self.assertIn('1 комментариев'.encode(), pages[1])
+
+
+class TestCachedReverse(TestCase):
+    def test_same_as_reverse(self):
+        for name, args in (('profile', ('a.b+c',)), ('post', ('who', 5)),
+                           ('post_delete', ('who', 5)), ('group', ('cats',))):
+            for _ in range(2):
+                self.assertEqual(cached_reverse(name, *args),
+                                 reverse(name, args=args))
+
+    def test_script_prefix(self):
+        self.assertEqual(cached_reverse('profile', 'who'), '/who/')
+        set_script_prefix('/yatube/')
+        self.addCleanup(set_script_prefix, '/')
+        self.assertEqual(cached_reverse('profile', 'who'), '/yatube/who/')
+
+    def test_urlconf_reload(self):
+        self.assertEqual(cached_reverse('profile', 'who'), '/who/')
+        with override_settings(ROOT_URLCONF=__name__):
+            self.assertEqual(cached_reverse('profile', 'who'),
+                             '/people/who/')
+        self.assertEqual(cached_reverse('profile', 'who'), '/who/')
+
+    def test_model_urls(self):
+        author = User.objects.create_user(username='who')
+        group = Group.objects.create(title='Cats', slug='cats')
+        post = Post.objects.create(text='meow', author=author, group=group)
+        self.assertEqual(group.get_absolute_url(), '/group/cats/')
+        self.assertEqual(post.author_url, '/who/')
+        self.assertEqual(post.get_absolute_url(), f'/who/{post.pk}/')
+        self.assertEqual(post.edit_url, f'/who/{post.pk}/edit/')
+        self.assertEqual(post.delete_url, f'/who/{post.pk}/delete')
+
+
+class TestLeanContext(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='regular')
+        group = Group.objects.create(title='Lean', slug='lean')
+        Post.objects.create(text='lean', author=self.user, group=group)
+        self.urls = [reverse('index'), reverse('group', args=['lean']),
+                     reverse('popular'), reverse('groups')]
+
+    def tables(self, client, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+        return ' '.join(query['sql'] for query in queries)
+
+    def test_year_memoized(self):
+        first = context_processors.year(None)['year']
+        self.assertEqual(first, datetime.date.today().year)
+        self.assertEqual(context_processors.year(None)['year'], first)
+
+    def test_anonymous_skips_session_and_user(self):
+        for url in self.urls:
+            sql = self.tables(Client(), url)
+            self.assertNotIn('FROM "django_session"', sql)
+            self.assertNotIn('FROM "auth_user"', sql)
+
+    def test_session_read_once(self):
+        client = Client()
+        client.force_login(self.user)
+        client.get(self.urls[0])
+        for url in self.urls:
+            with CaptureQueriesContext(connection) as queries:
+                client.get(url)
+            self.assertEqual(len([query for query in queries
+                                  if 'FROM "django_session"' in query['sql']]),
+                             1)
+
+
+class TestPageCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='owner')
+        self.reader = User.objects.create_user(username='visitor')
+        self.group = Group.objects.create(title='Shared', slug='shared')
+        self.post = Post.objects.create(text='cached text', author=self.author,
+                                        group=self.group)
+        self.urls = [
+            reverse('group', args=[self.group.slug]),
+            reverse('profile', args=[self.author.username]),
+            reverse('post', args=[self.author.username, self.post.id]),
+        ]
+
+    def viewer(self, user=None):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        return client
+
+    def test_one_rendering_for_all_viewers(self):
+        anonymous, reader = self.viewer(), self.viewer(self.reader)
+        author = self.viewer(self.author)
+        author.get(reverse('groups'))
+        for url in self.urls:
+            with self.subTest(url=url):
+                page = anonymous.get(url).content.decode()
+                self.assertIn('Войти', page)
+                self.assertNotIn('Редактировать', page)
+                with self.assertNumQueries(2):
+                    # только сессия и пользователь, страница из кэша
+                    page = author.get(url).content.decode()
+                self.assertIn('Пользователь: owner', page)
+                self.assertIn('Редактировать', page)
+                self.assertNotIn('<!--hole', page)
+                page = reader.get(url).content.decode()
+                self.assertIn('Пользователь: visitor', page)
+                self.assertNotIn('Редактировать', page)
+
+    def test_follow_button_and_comment_form(self):
+        reader = self.viewer(self.reader)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.viewer().get(self.urls[2])
+        page = reader.get(self.urls[2]).content.decode()
+        self.assertIn('Отписаться', page)
+        self.assertIn('csrfmiddlewaretoken', page)
+        self.assertNotIn('csrfmiddlewaretoken',
+                         self.viewer().get(self.urls[2]).content.decode())
+
+    def test_changes_invalidate_pages(self):
+        reader = self.viewer(self.reader)
+        reader.get(self.urls[2])
+        reader.post(reverse('add_comment',
+                            args=[self.author.username, self.post.id]),
+                    {'text': 'fresh comment'})
+        self.assertContains(reader.get(self.urls[2]), 'fresh comment')
+        Post.objects.create(text='second post', author=self.author,
+                            group=self.group)
+        for url in self.urls[:2]:
+            self.assertContains(reader.get(url), 'second post')
+
+    def test_invalidation_scoped_by_author_and_group(self):
+        other = User.objects.create_user(username='bystander')
+        reader = self.viewer(self.reader)
+        for url in self.urls:
+            reader.get(url)
+        Post.objects.create(text='elsewhere', author=other)
+        Comment.objects.create(post=Post.objects.create(
+            text='aside', author=other), author=self.reader, text='hi')
+        Follow.objects.create(user=self.reader, author=other)
+        # кнопка подписки перечитывает подписки читателя один раз
+        graph.followees(self.reader.id)
+        for url in self.urls:
+            with self.assertNumQueries(2):
+                reader.get(url)
+        Comment.objects.create(post=self.post, author=other, text='hey')
+        for url in self.urls:
+            self.assertContains(reader.get(url), '1 комментариев'
+                                if url != self.urls[2] else 'hey')
+
+
+class TestFlatPages(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.page = FlatPage.objects.create(
+            url='/about-author/', title='Автор', content='<p>first</p>')
+        self.page.sites.add(settings.SITE_ID)
+        self.url = reverse('django.contrib.flatpages.views.flatpage',
+                           args=['about-author/'])
+
+    def test_served_from_cache(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, '<p>first</p>')
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        client = Client()
+        client.force_login(User.objects.create_user(username='reader'))
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Пользователь: reader')
+        self.assertNotIn('ETag', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_admin_save_invalidates(self):
+        etag = self.client.get(self.url)['ETag']
+        self.page.content = '<p>second</p>'
+        self.page.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, '<p>second</p>')
+        self.page.sites.clear()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_other_process_changes_expire(self):
+        self.client.get(self.url)
+        # правка из другого процесса не вызывает сигналов этого
+        FlatPage.objects.filter(pk=self.page.pk).update(
+            content='<p>second</p>')
+        self.assertContains(self.client.get(self.url), '<p>first</p>')
+        expired = time.time() + settings.FLATPAGES_TIMEOUT + 1
+        with mock.patch('time.time', return_value=expired):
+            self.assertContains(self.client.get(self.url), '<p>second</p>')
+
+    def test_missing_and_private_pages(self):
+        self.assertEqual(self.client.get('/about/nothing/').status_code, 404)
+        self.assertRedirects(self.client.get('/about/about-author'),
+                             '/about/about-author/', status_code=301)
+        self.page.registration_required = True
+        self.page.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response['Location'])
+
+
+class TestSeed(TestCase):
+    options = dict(users=30, groups=3, posts=200, comments=400,
+                   follows=150, until=1.6e9, seed=7)
+
+    def test_seed_command(self):
+        out = StringIO()
+        cache.set('unrelated', 1)
+        call_command('seed', images=2, stdout=out, **self.options)
+        self.assertEqual(cache.get('unrelated'), 1)
+        self.assertIn('posts: 200', out.getvalue())
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        comments = Comment.objects.count()
+        self.assertAlmostEqual(comments, 400, delta=40)
+        self.assertFalse(Follow.objects.filter(
+            user_id=models.F('author_id')).exists())
+        # авторство по Ципфу: первый автор пишет больше всех
+        counts = sorted(Post.objects.order_by().values('author').annotate(
+            count=models.Count('id')).values_list('count', flat=True))
+        self.assertGreater(counts[-1], 5 * counts[len(counts) // 2])
+        post = Post.objects.order_by('-hot').first()
+        self.assertGreaterEqual(post.pub_date.timestamp(), 1.6e9 - 30 * 86400)
+        for comment in post.comments.all():
+            self.assertGreaterEqual(comment.created, post.pub_date)
+        self.assertEqual(trending.top_post_ids()[0], post.pk)
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        # новые строки получают следующие ключи
+        call_command('seed', stdout=out, **self.options)
+        self.assertEqual(User.objects.count(), 60)
+        self.assertEqual(Post.objects.count(), 400)
+        user = User.objects.create_user(username='after-seed')
+        self.assertEqual(user.pk, 61)
+
+    def test_same_rows_for_any_number_of_processes(self):
+        plan = seed.plan(**self.options)
+        serial = list(seed.chunks(plan, 'posts', plan.posts))
+        with Pool(2) as pool:
+            parallel = list(seed.chunks(plan, 'posts', plan.posts, pool))
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serial, list(seed.chunks(
+            seed.plan(**self.options), 'posts', plan.posts)))
+
+
+class TestStartup(TestCase):
+    # модули, которые процесс не должен грузить при старте
+    lazy = ['debug_toolbar', 'PIL', 'django.test', 'yatube.keys',
+            'yatube.flatpages', 'sorl.thumbnail.images']
+
+    def test_lazy_imports(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='yatube.settings',
+                   YATUBE_DEBUG='0', YATUBE_SECRET_KEY='startup',
+                   YATUBE_HOSTS='localhost,testserver')
+        result = subprocess.run(
+            [sys.executable, '-c',
+             'import django, sys; django.setup(); print(*sys.modules)'],
+            env=env, cwd=settings.BASE_DIR, check=True,
+            capture_output=True, text=True)
+        modules = set(result.stdout.split())
+        self.assertIn('posts.signals', modules)
+        self.assertEqual([name for name in self.lazy if name in modules], [])
+
+
+class TestArchive(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='chronicler')
+        self.group = Group.objects.create(title='History', slug='history')
+        old = [Post.objects.create(text=f'old post {i}', author=self.author,
+                                   group=self.group) for i in range(3)]
+        Post.objects.filter(pk__in=[post.pk for post in old]).update(
+            pub_date=OLD_DATE)
+        self.old = old[0]
+        for text in ('first', 'second'):
+            Comment.objects.create(post=self.old, author=self.author,
+                                   text=text)
+        for i in range(12):
+            Post.objects.create(text=f'new post {i}', author=self.author,
+                                group=self.group)
+        out = StringIO()
+        call_command('archive_posts', stdout=out)
+        self.assertIn('Archived 3 posts and 2 comments', out.getvalue())
+
+    def test_tables(self):
+        self.assertEqual(Post.objects.count(), 12)
+        self.assertEqual(ArchivedPost.objects.count(), 3)
+        archived = ArchivedPost.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.text, 'old post 0')
+        self.assertEqual(archived.group, self.group)
+        self.assertEqual(
+            list(archived.comments.values_list('text', flat=True)),
+            ['first', 'second'])
+        self.assertFalse(Comment.objects.exists())
+
+    def test_feeds_fall_through(self):
+        for url in [reverse('index'), reverse('group', args=['history']),
+                    reverse('profile', args=['chronicler'])]:
+            response = self.client.get(url)
+            self.assertEqual(response.context['paginator'].count, 15)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'page': 1, 'fresh': 1})
+            self.assertFalse([query for query in queries
+                              if 'posts_archived' in query['sql']])
+            response = self.client.get(url, {'page': 2})
+            texts = [post.text for post in response.context['page']]
+            # у архивных постов одна дата, порядок между ними не важен
+            self.assertEqual(sorted(texts[2:]), ['old post 0', 'old post 1',
+                                                 'old post 2'])
+            self.assertContains(response, '2 комментариев')
+        self.assertEqual(response.context['count_posts'], 15)
+
+    def test_post_view_transparent(self):
+        url = reverse('post', args=['chronicler', self.old.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.context['post'].text, 'old post 0')
+        self.assertEqual([comment.text for comment
+                          in response.context['comments']],
+                         ['first', 'second'])
+        self.client.force_login(self.author)
+        response = self.client.post(reverse('add_comment',
+                                            args=['chronicler', self.old.pk]),
+                                    {'text': 'late'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(ArchivedComment.objects.count(), 2)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(archive.count(ArchivedPost.objects.all()), 3)
+
+    def test_counts_expire(self):
+        authored = ArchivedPost.objects.filter(author=self.author)
+        self.assertEqual(archive.count(authored), 3)
+        # правка из другого процесса не меняет версию архива этого
+        other = ArchivedPost.objects.exclude(pk=self.old.pk).first()
+        ArchivedPost.objects.filter(pk=other.pk).update(
+            author=User.objects.create_user(username='successor'))
+        self.assertEqual(archive.count(authored), 3)
+        expired = time.time() + settings.ARCHIVE_COUNT_TIMEOUT + 1
+        with mock.patch('time.time', return_value=expired):
+            self.assertEqual(archive.count(authored), 2)
+
+
+class TestDeletion(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='prolific')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Crowd', slug='crowd')
+        self.posts = [Post.objects.create(text=f'post {i}', author=self.author,
+                                          group=self.group)
+                      for i in range(5)]
+        self.other = Post.objects.create(text='other', author=self.reader,
+                                         group=self.group)
+        for post in self.posts:
+            for text in ('one', 'two', 'three'):
+                Comment.objects.create(post=post, author=self.reader,
+                                       text=text)
+        Comment.objects.create(post=self.other, author=self.author,
+                               text='mine')
+        Comment.objects.create(post=self.other, author=self.reader,
+                               text='theirs')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+
+    def test_post_delete_view(self):
+        client = Client()
+        client.force_login(self.reader)
+        post = self.posts[0]
+        # чужой пост удалить нельзя
+        client.get(reverse('post_delete', args=['reader', post.id]))
+        self.assertTrue(Post.objects.filter(pk=post.pk).exists())
+        self.assertEqual(group_stats.stats(self.group.id)['post_count'], 6)
+        client.force_login(self.author)
+        client.get(reverse('post_delete', args=['prolific', post.id]))
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        self.assertEqual(group_stats.stats(self.group.id)['post_count'], 5)
+        self.assertNotIn(post.pk, trending.top_post_ids(self.group.id))
+        response = client.get(reverse('post', args=['prolific', post.id]))
+        self.assertEqual(response.status_code, 404)
+        # восстанавливается вместе с комментариями
+        self.assertEqual(deletion.restore(Post.all_objects.all()), 1)
+        self.assertEqual(Post.objects.get(pk=post.pk).comment_count, 3)
+        self.assertEqual(group_stats.stats(self.group.id)['post_count'], 6)
+        self.assertIn(post.pk, trending.top_post_ids(self.group.id))
+        # число запросов чистки не зависит от числа комментариев
+        deletion.trash(Post.objects.filter(author=self.author))
+        with self.assertNumQueries(7):
+            deletion.purge(timezone.now() + datetime.timedelta(days=1))
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_delete_user(self):
+        old = self.posts[0]
+        Post.objects.filter(pk=old.pk).update(pub_date=OLD_DATE)
+        archive.archive(timezone.now() - datetime.timedelta(days=1))
+        self.assertEqual(list(graph.followers(self.reader.id)),
+                         [self.author.id])
+        out = StringIO()
+        call_command('delete_user', 'prolific', chunk_size=2, stdout=out)
+        self.assertIn('4 posts, 13 comments, 1 archived posts, '
+                      '3 archived comments, 2 follows', out.getvalue())
+        self.assertFalse(User.objects.filter(username='prolific').exists())
+        self.assertEqual(list(Post.objects.all()), [self.other])
+        self.assertEqual(list(Comment.objects.values_list('text', flat=True)),
+                         ['theirs'])
+        self.assertFalse(ArchivedPost.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(list(graph.followers(self.reader.id)), [])
+        self.assertEqual(group_stats.stats(self.group.id)['post_count'], 1)
+        self.assertEqual(trending.top_post_ids(), [self.other.pk])
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['paginator'].count, 1)
+
+    def test_delete_group(self):
+        group_stats.group_index()
+        self.assertEqual(deletion.delete_group(self.group, chunk_size=4), 6)
+        self.assertFalse(Group.objects.exists())
+        self.assertFalse(Post.objects.exclude(group=None).exists())
+        self.assertEqual(Post.objects.count(), 6)
+        self.assertEqual(group_stats.group_index(), [])
+
+
+class TestSoftDelete(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='writer')
+        self.posts = [Post.objects.create(text=f'post {i}', author=self.author)
+                      for i in range(3)]
+        self.comment = Comment.objects.create(post=self.posts[0],
+                                              author=self.author, text='hi')
+
+    def test_tombstones_hidden(self):
+        deletion.trash(Post.objects.filter(pk=self.posts[1].pk))
+        deletion.trash(Comment.objects.filter(pk=self.comment.pk))
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Post.all_objects.count(), 3)
+        self.assertEqual(self.author.author_posts.count(), 2)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['paginator'].count, 2)
+        self.assertNotContains(response, '1 комментариев')
+        response = self.client.get(reverse('post', args=['writer',
+                                                         self.posts[0].pk]))
+        self.assertEqual(list(response.context['comments']), [])
+
+    def test_purge_after_grace_window(self):
+        deletion.trash(Post.objects.filter(pk=self.posts[0].pk))
+        deletion.trash(Comment.objects.filter(pk=self.comment.pk))
+        out = StringIO()
+        call_command('purge_deleted', pause=0, stdout=out)
+        self.assertIn('Purged 0 posts and 0 comments', out.getvalue())
+        Post.all_objects.update(
+            deleted_at=timezone.now() - datetime.timedelta(
+                days=settings.SOFT_DELETE_GRACE_DAYS + 1))
+        call_command('purge_deleted', pause=0, batch_size=1, stdout=out)
+        self.assertIn('Purged 1 posts and 1 comments', out.getvalue())
+        self.assertEqual(Post.all_objects.count(), 2)
+        self.assertFalse(Comment.all_objects.exists())
+
+    def test_archived_tombstones_wait_for_purge(self):
+        deletion.trash(Comment.objects.filter(pk=self.comment.pk))
+        deleted_at = Comment.all_objects.get(pk=self.comment.pk).deleted_at
+        Post.objects.filter(pk=self.posts[0].pk).update(pub_date=OLD_DATE)
+        self.assertEqual(archive.archive(OLD_DATE + datetime.timedelta(1)),
+                         (1, 0))
+        archived = ArchivedComment.all_objects.get(pk=self.comment.pk)
+        self.assertEqual((archived.is_deleted, archived.deleted_at),
+                         (True, deleted_at))
+        self.assertFalse(ArchivedComment.objects.exists())
+        self.assertEqual(deletion.purge(deleted_at), (0, 0))
+        self.assertEqual(
+            deletion.purge(deleted_at + datetime.timedelta(1)), (0, 1))
+        self.assertFalse(ArchivedComment.all_objects.exists())
+
+    def query_plan(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + str(queryset.query))
+            return ' '.join(str(row[-1]) for row in cursor.fetchall())
+
+    def test_feed_uses_index(self):
+        plan = self.query_plan(Post.objects.all()[:10])
+        self.assertIn('posts_post_is_dele', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_comments_use_index(self):
+        plan = self.query_plan(self.posts[0].comments.all()[:10])
+        self.assertIn('posts_comme_post_id_7fc1a3_idx', plan)
+        self.assertIn('is_deleted=?', plan)
+
+
+class TestAdminChangelists(TestCase):
+    URLS = ['admin:posts_post_changelist', 'admin:posts_comment_changelist',
+            'admin:posts_follow_changelist', 'admin:posts_group_changelist',
+            'admin:posts_archivedpost_changelist',
+            'admin:posts_archivedcomment_changelist']
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            username='moderator', email='moderator@example.com',
+            password='secret')
+        self.client.force_login(self.admin)
+        self.group = Group.objects.create(title='Moderated', slug='moderated')
+        self.rows = 0
+
+    def add_rows(self, count):
+        for i in range(self.rows, self.rows + count):
+            user = User.objects.create_user(username=f'member{i}')
+            post = Post.objects.create(text=f'post {i}', author=user,
+                                       group=self.group)
+            Comment.objects.create(post=post, author=user, text=f'reply {i}')
+            Follow.objects.create(user=user, author=self.admin)
+        self.rows += count
+
+    def queries(self, url, **params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url), params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.add_rows(2)
+        archive.archive(timezone.now() - datetime.timedelta(days=1))
+        few = {url: self.queries(url) for url in self.URLS}
+        self.add_rows(20)
+        Post.objects.update(pub_date=OLD_DATE)
+        archive.archive(timezone.now() - datetime.timedelta(days=1))
+        self.add_rows(20)
+        self.assertEqual({url: self.queries(url) for url in self.URLS}, few)
+
+    def test_no_full_count(self):
+        self.add_rows(3)
+        url = 'admin:posts_post_changelist'
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(reverse(url), {'q': 'post 1'})
+        # всю таблицу не считают, только найденные строки
+        self.assertEqual(len([query for query in cold
+                              if 'COUNT(' in query['sql']]), 1)
+        with CaptureQueriesContext(connection) as warm:
+            self.client.get(reverse(url), {'q': 'post 1'})
+        # число строк берётся из кэша
+        self.assertEqual(len(warm), len(cold) - 1)
+        self.assertFalse([query for query in warm
+                          if 'COUNT(' in query['sql']])
+
+    def test_search(self):
+        self.add_rows(3)
+        response = self.client.get(reverse('admin:posts_follow_changelist'),
+                                   {'q': 'member1'})
+        follows = response.context['cl'].result_list
+        self.assertEqual([str(follow.user) for follow in follows],
+                         ['member1'])
+        # выпадающих списков всех пользователей нет
+        self.assertNotContains(response, 'member2')
+        response = self.client.get(reverse('admin:posts_group_changelist'),
+                                   {'q': 'moder'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.group])
+        response = self.client.get(
+            reverse('admin:posts_comment_change',
+                    args=[Comment.objects.first().pk]))
+        self.assertNotContains(response, 'member2')
+
+
+@override_settings(RATE_LIMITS={
+    'add_comment': {'user': (1 / 60, 2), 'ip': (1 / 60, 3)},
+    'follow': {'user': (1, 30), 'ip': (1, 30)},
+})
+class TestRateLimit(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='talker')
+        self.other = User.objects.create_user(username='listener')
+        self.post = Post.objects.create(text='say', author=self.author)
+        self.url = reverse('add_comment', args=['talker', self.post.pk])
+
+    def comment(self, user, address='10.0.0.1'):
+        client = Client(REMOTE_ADDR=address)
+        client.force_login(user)
+        return client.post(self.url, {'text': 'spam'})
+
+    def test_burst_rejected(self):
+        for _ in range(2):
+            self.assertEqual(self.comment(self.author).status_code, 302)
+        client = Client(REMOTE_ADDR='10.0.0.1')
+        client.force_login(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(self.url, {'text': 'spam'})
+        self.assertEqual(response.status_code, 429)
+        # до комментариев и постов запрос не доходит
+        self.assertFalse([query for query in queries
+                          if 'posts_' in query['sql']])
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(Comment.objects.count(), 2)
+        client = Client()
+        client.force_login(self.author)
+        # просмотр страниц не ограничен
+        self.assertEqual(client.get(reverse('new_post')).status_code, 200)
+
+    def test_user_and_address_buckets(self):
+        self.comment(self.author)
+        self.comment(self.author)
+        # тот же адрес, другой пользователь: у адреса корзина больше
+        self.assertEqual(self.comment(self.other).status_code, 302)
+        self.assertEqual(self.comment(self.other).status_code, 429)
+        # тот же пользователь, другой адрес
+        self.assertEqual(self.comment(self.author, '10.0.0.2').status_code,
+                         429)
+        self.assertEqual(self.comment(self.other, '10.0.0.2').status_code,
+                         302)
+
+    def test_refill(self):
+        limits = {'a': (0.5, 1), 'b': (1, 2)}
+        buckets, wait = ratelimit.take({}, limits, 0)
+        self.assertEqual((buckets, wait), ({'a': (0, 0), 'b': (1, 0)}, 0))
+        self.assertEqual(ratelimit.take(buckets, limits, 1), ({}, 1))
+        buckets, wait = ratelimit.take(buckets, limits, 2)
+        self.assertEqual(wait, 0)
+        self.assertEqual(buckets, {'a': (0, 2), 'b': (1, 2)})
+
+    def test_cost(self):
+        limits = {'a': (1, 5)}
+        buckets, wait = ratelimit.take({}, limits, 0, cost=3)
+        self.assertEqual((buckets, wait), ({'a': (2, 0)}, 0))
+        self.assertEqual(ratelimit.take(buckets, limits, 0, cost=3), ({}, 1))
+
+    def test_local_fallback(self):
+        def unavailable(*args, **kwargs):
+            raise ConnectionError
+        original = ratelimit.cache.get_many
+        ratelimit.cache.get_many = unavailable
+        self.addCleanup(setattr, ratelimit.cache, 'get_many', original)
+        self.addCleanup(ratelimit.local_buckets._buckets.clear)
+        with self.assertLogs('yatube.ratelimit', 'WARNING'):
+            statuses = [self.comment(self.author).status_code
+                        for _ in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
+
+
+class TestFollowerMail(TestCase):
+    def setUp(self):
+        cache.clear()
+        graph.clear()
+        self.author = User.objects.create_user(username='novelist')
+        self.reader = User.objects.create_user(username='fan',
+                                               email='fan@example.com')
+        User.objects.create_user(username='stranger',
+                                 email='stranger@example.com')
+        User.objects.create_user(username='silent')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=User.objects.get(username='silent'),
+                              author=self.author)
+
+    def test_followers_notified(self):
+        client = Client()
+        client.force_login(self.author)
+        client.post(reverse('new_post'), {'text': 'Глава первая'})
+        post = Post.objects.get()
+        # письма не отправляются в запросе
+        self.assertEqual(mail.outbox, [])
+        run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ['fan@example.com'])
+        self.assertEqual(message.subject, 'Новая запись автора novelist')
+        self.assertIn('Глава первая', message.body)
+        self.assertIn(post.get_absolute_url(), message.body)
+
+    def test_recipients_read_once_from_database(self):
+        graph.followers(self.author.id)
+        # подписка из другого процесса не сбрасывает граф этого
+        Follow.objects.bulk_create([Follow(
+            user=User.objects.get(username='stranger'), author=self.author)])
+        post = Post.objects.create(text='Глава вторая', author=self.author)
+        tasks.notify_followers.enqueue(post.pk, key=tasks.notify_key(post.pk))
+        run_pending()
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['fan@example.com', 'stranger@example.com'])
+
+    @override_settings(SITE_SCHEME='https')
+    def test_followers_mailed_in_chunks(self):
+        for i in range(4):
+            Follow.objects.create(author=self.author,
+                                  user=User.objects.create_user(
+                                      username=f'reader{i}',
+                                      email=f'reader{i}@example.com'))
+        with mock.patch('posts.tasks.NOTIFY_CHUNK_SIZE', 2):
+            Post.objects.create(text='Глава третья', author=self.author)
+            run_pending()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(len({message.to[0] for message in mail.outbox}), 5)
+        self.assertIn('https://', mail.outbox[0].body)
+        # по задаче на порцию, каждая ставит следующую вместе со своей
+        self.assertEqual(Job.objects.filter(
+            name=tasks.notify_followers.task_name).count(), 3)
+
+    def test_no_job_without_followers(self):
+        Post.objects.create(text='alone', author=self.reader)
+        self.assertFalse(Job.objects.filter(
+            name=tasks.notify_followers.task_name).exists())
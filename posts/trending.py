@@ -0,0 +1,120 @@
+"""Time-decayed popularity ranking of posts
+
+A post score is the sum of its events weighted by 2 ** (age / half life)
+counted from a fixed epoch, so newer events outweigh older ones and
+scores never have to be decayed in place. Scores are stored as log2 to
+stay in float range and updated on every new post and comment. The best
+posts overall and in every group are kept in the cache as bounded top-K
+lists.
+
+The lists are updated in place by the process that records an event and
+rebuilt from the scores in the database after TRENDING_TOP_TIMEOUT
+seconds, so every process of the site, whatever its cache, catches up
+with posts and comments recorded by the others within that time.
+"""
+import heapq
+import math
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .follow_graph import graph
+from .models import Post
+
+EPOCH = 1577836800  # 2020-01-01 00:00 UTC
+GLOBAL = 'trending:global'
+
+# чтение, изменение и запись списка в кэше не атомарны
+_lock = threading.Lock()
+
+
+def top_key(group_id=None):
+    return GLOBAL if group_id is None else f'trending:group:{group_id}'
+
+
+def event_score(when, weight):
+    """log2 of the weight of an event happened at the given time"""
+    age = when.timestamp() - EPOCH
+    return math.log2(weight) + age / settings.TRENDING_HALF_LIFE
+
+
+def log_add(a, b):
+    """log2(2 ** a + 2 ** b) computed without overflow"""
+    if a < b:
+        a, b = b, a
+    return a + math.log2(1 + 2 ** (b - a))
+
+
+def post_score(post):
+    """Initial score of a post, authors with more followers start higher"""
+    followers = graph.follower_counts([post.author_id])[post.author_id]
+    weight = 1 + settings.TRENDING_FOLLOWER_WEIGHT * math.log1p(followers)
+    # новый пост оценивается до сохранения, когда auto_now_add ещё не
+    # проставил дату
+    return event_score(post.pub_date or timezone.now(), weight)
+
+
+def _push(key, post_id, hot):
+    with _lock:
+        top = cache.get(key)
+        if top is None:
+            # the list is built from the database on the next read
+            return
+        entries = {pk: score for score, pk in top}
+        entries[post_id] = hot
+        top = heapq.nlargest(settings.TRENDING_TOP_K,
+                             ((score, pk) for pk, score in entries.items()))
+        cache.set(key, top, settings.TRENDING_TOP_TIMEOUT)
+
+
+def _publish(post_id, group_id, hot):
+    _push(GLOBAL, post_id, hot)
+    if group_id is not None:
+        _push(top_key(group_id), post_id, hot)
+
+
+def record_post(post):
+    """Adds a saved new post to the top lists, its score is set by the
+    pre_save signal"""
+    _publish(post.pk, post.group_id, post.hot)
+
+
+def record_comment(comment):
+    event = event_score(comment.created, settings.TRENDING_COMMENT_WEIGHT)
+    with transaction.atomic():
+        row = (Post.objects.select_for_update()
+               .filter(pk=comment.post_id)
+               .values_list('hot', 'group_id').first())
+        if row is None:
+            return
+        hot, group_id = row
+        hot = log_add(hot, event)
+        Post.objects.filter(pk=comment.post_id).update(hot=hot)
+    _publish(comment.post_id, group_id, hot)
+
+
+def rebuild(group_id=None):
+    """Reloads a top-K list from the hot index of the posts table"""
+    posts = Post.objects.all()
+    if group_id is not None:
+        posts = posts.filter(group_id=group_id)
+    top = [(score, pk) for score, pk in posts.order_by('-hot', '-pk')
+           .values_list('hot', 'pk')[:settings.TRENDING_TOP_K]]
+    cache.set(top_key(group_id), top, settings.TRENDING_TOP_TIMEOUT)
+    return top
+
+
+def invalidate(*group_ids):
+    """Drops the cached lists of the groups, None stands for the list
+    of the whole site"""
+    cache.delete_many([top_key(group_id) for group_id in set(group_ids)])
+
+
+def top_post_ids(group_id=None):
+    top = cache.get(top_key(group_id))
+    if top is None:
+        top = rebuild(group_id)
+    return [pk for score, pk in top]
@@ -5,7 +5,11 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('follow/bulk/', views.follow_bulk, name='follow_bulk'),
+    path('popular/', views.popular, name='popular'),
+    path('groups/', views.group_index, name='groups'),
     path('group/<slug:slug>/', views.group_posts, name='group'),
+    path('group/<slug:slug>/popular/', views.popular, name='group_popular'),
     path('new/', views.new_post, name="new_post"),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
@@ -15,6 +19,8 @@ urlpatterns = [
     path('500/', views.server_error, name="server_error"),
     path("<str:username>/<int:post_id>/comment", views.add_comment,
          name="add_comment"),
+    path("<str:username>/<int:post_id>/comments/", views.post_comments,
+         name="post_comments"),
     path("<username>/<int:post_id>/delete", views.post_delete,
          name="post_delete"),
     path("<str:username>/follow/", views.profile_follow,
@@ -1,29 +1,108 @@
+from django.conf import settings
+from django.db.models import Count, Q
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
-from .models import Comment, Follow, Group, Post, User
+from django.core.paginator import Page, Paginator
+from django.http import Http404, HttpResponseBadRequest
+from django.views.decorators.http import require_POST
+from yatube.ratelimit import rate_limited
+from . import deletion, group_stats
+from .archive import Feed, count, get_post
+from .page_cache import cached_page, depends_on
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                     Post, User)
+from .follow_graph import graph
+from .follows import follow_many, unfollow_many
+from .trending import top_post_ids
 from .forms import CommentForm, PostForm
 
+# наибольший первичный ключ, который принимает база
+MAX_PK = 2 ** 63 - 1
 
-@cache_page(20, key_prefix='index_page')
+
+def follow_counts(author):
+    """Follower and followee counts shown on the author card"""
+    return {
+        'followers_count': graph.follower_counts([author.id])[author.id],
+        'following_count': graph.followee_counts([author.id])[author.id],
+    }
+
+
+def load_cards(posts):
+    """Counts comments of all posts of a feed page with one query,
+    and one more when the page reaches the archive"""
+    posts = list(posts)
+    for model, comments in ((Post, Comment), (ArchivedPost, ArchivedComment)):
+        part = [post for post in posts if isinstance(post, model)]
+        if part:
+            counts = dict(comments.objects.filter(post__in=part).order_by()
+                          .values_list('post').annotate(Count('id')))
+            for post in part:
+                post.comment_count = counts.get(post.pk, 0)
+    return posts
+
+
+def paginate(request, posts, archived, count=None):
+    """Paginates a feed, post authors and groups come with the posts.
+    Archived posts follow the live ones"""
+    feed = Feed(posts.select_related('author', 'group'),
+                archived.select_related('author', 'group'), count)
+    paginator = Paginator(feed, 10)
+    page = paginator.get_page(request.GET.get('page'))
+    page.object_list = load_cards(page.object_list)
+    return paginator, page
+
+
+@cached_page(20, versioned=False)
 def index(request):
     """View function for Index page"""
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator, page = paginate(request, Post.objects.all(),
+                               ArchivedPost.objects.all())
     return render(request, 'index.html',
                   {'page': page, 'paginator': paginator})
 
 
+def popular(request, slug=None):
+    """View function for the popular posts page of the site or a group"""
+    group = get_object_or_404(Group, slug=slug) if slug else None
+    paginator = Paginator(top_post_ids(group and group.id), 10)
+    page = paginator.get_page(request.GET.get('page'))
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        page.object_list)
+    page.object_list = load_cards(
+        posts[pk] for pk in page.object_list if pk in posts)
+    return render(request, 'popular.html',
+                  {'group': group, 'page': page, 'paginator': paginator})
+
+
+def group_index(request):
+    """View function for the list of communities"""
+    return render(request, 'groups.html',
+                  {'groups': group_stats.group_index()})
+
+
+@cached_page()
 def group_posts(request, slug):
     """View function for community page"""
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
+    depends_on(request, groups=[group.id])
+    posts = group.posts.select_related('author', 'group')
+    feed = Feed(posts, group.archived_posts.select_related('author', 'group'),
+                group_stats.stats(group.id)['post_count'])
+    paginator = Paginator(feed, group_stats.PAGE_SIZE)
     page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    ids = []
+    if page_number in (None, '1'):
+        ids = group_stats.first_page_ids(group.id)
+    # первая страница из кэша, если она целиком из живых постов
+    if ids and (len(ids) == group_stats.PAGE_SIZE
+                or not feed.archived_count()):
+        first_page = posts.in_bulk(ids)
+        page = Page(load_cards(first_page[pk] for pk in ids
+                               if pk in first_page), 1, paginator)
+    else:
+        page = paginator.get_page(page_number)
+        page.object_list = load_cards(page.object_list)
     return render(request, 'group.html',
                   {'group': group,
                    'page': page,
@@ -32,6 +111,7 @@ def group_posts(request, slug):
 
 
 @login_required
+@rate_limited('new_post')
 def new_post(request):
     """View function for creating new post page"""
     if request.method == "POST":
@@ -46,41 +126,86 @@ def new_post(request):
     return render(request, "new_post.html", {"form": form})
 
 
+@cached_page()
 def profile(request, username):
     """Adds a profile page with posts"""
     author = get_object_or_404(User, username=username)
-    post_list = author.author_posts.all()
-    count_posts = post_list.count()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    following = (Follow.objects.filter(user=request.user,
-                                       author=author).exists()
-                 if request.user.is_authenticated else False)
+    depends_on(request, authors=[author.id])
+    live_posts = author.author_posts.count()
+    paginator, page = paginate(request, author.author_posts.all(),
+                               author.archived_posts.all(), live_posts)
+    count_posts = paginator.count
     return render(request, 'profile.html', {
         'page': page,
         'paginator': paginator,
         'count_posts': count_posts,
         'profile': author,
-        'following': following})
+        **follow_counts(author)})
+
+
+def comments_page(post, after=None):
+    """Returns a page of post comments following the cursor
+    and the cursor for the next page"""
+    comments = post.comments.all()
+    if after:
+        created = (comments.model.objects.filter(pk=after, post=post)
+                   .values_list('created', flat=True).first())
+        if created is None:
+            raise Http404('Комментарий удалён')
+        comments = comments.filter(Q(created__gt=created)
+                                   | Q(created=created, pk__gt=after))
+    # лишний id показывает, есть ли следующая страница; ключи берутся
+    # из индекса, сама страница остаётся QuerySet для шаблона
+    ids = list(comments.values_list('pk', flat=True)
+               [:settings.COMMENTS_PER_PAGE + 1])
+    next_cursor = None
+    if len(ids) > settings.COMMENTS_PER_PAGE:
+        del ids[settings.COMMENTS_PER_PAGE:]
+        next_cursor = ids[-1]
+    return (post.comments.select_related('author').filter(pk__in=ids),
+            next_cursor)
 
 
+@cached_page()
 def post_view(request, username, post_id):
     """Creates a Page for viewing a separate post"""
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(author.author_posts, id=post_id)
-    selected_post = get_object_or_404(Post, pk=post_id,
-                                      author__username=username)
-    count_posts = author.author_posts.count()
+    post = get_post(id=post_id, author__username=username)
+    depends_on(request, authors=[post.author_id])
+    author = post.author
+    count_posts = (author.author_posts.count()
+                   + count(author.archived_posts.all()))
     form = CommentForm()
-    comments = Comment.objects.filter(post=post_id)
+    if settings.COMMENTS_LAZY_LOAD:
+        comments, next_cursor = post.comments.none(), None
+    else:
+        comments, next_cursor = comments_page(post)
     return render(request, 'post_view.html', {
         'profile': author,
-        'selected_post': selected_post,
+        'selected_post': post,
         'count_posts': count_posts,
         'form': form,
         'post': post,
-        'comments': comments})
+        'comments': comments,
+        'comments_lazy': settings.COMMENTS_LAZY_LOAD,
+        'next_cursor': next_cursor,
+        **follow_counts(author)})
+
+
+def post_comments(request, username, post_id):
+    """Renders the next page of post comments as an HTML fragment"""
+    post = get_post(id=post_id, author__username=username)
+    try:
+        after = int(request.GET.get('after', ''))
+    except ValueError:
+        after = None
+    # курсор вне диапазона ключей считается отсутствующим
+    if after is not None and not 0 < after <= MAX_PK:
+        after = None
+    comments, next_cursor = comments_page(post, after)
+    return render(request, 'includes/comment_list.html', {
+        'post': post,
+        'comments': comments,
+        'next_cursor': next_cursor})
 
 
 @login_required
@@ -109,14 +234,20 @@ def server_error(request):
 @login_required
 def post_delete(request, username, post_id):
     if username == request.user.username:
-        post = get_object_or_404(Post, id=post_id)
-        post.delete()
+        post = get_object_or_404(Post, id=post_id, author=request.user)
+        # пост скрывается сразу, удаляет его потом purge_deleted
+        deletion.trash(Post.objects.filter(pk=post.pk))
         return redirect('index')
     return redirect('index')
     
 
 @login_required
+@rate_limited('add_comment')
 def add_comment(request, username, post_id):
+    # архивные и удалённые посты только для чтения
+    if not Post.objects.filter(pk=post_id,
+                               author__username=username).exists():
+        raise Http404('Пост закрыт для комментариев')
     form = CommentForm(request.POST or None)
     if form.is_valid():
         form.instance.author = request.user
@@ -127,17 +258,19 @@ def add_comment(request, username, post_id):
 
 @login_required
 def follow_index(request):
-    user = request.user
-    authors = user.follower.all().values('author')
-    post_list = Post.objects.filter(author__in=authors)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    followees = graph.followees(request.user.id)
+    # длинный список id не помещается в параметры запроса SQLite
+    authors = (list(followees) if len(followees) <= 900
+               else request.user.follower.values('author'))
+    paginator, page = paginate(
+        request, Post.objects.filter(author__in=authors),
+        ArchivedPost.objects.filter(author__in=authors))
     return render(request, 'follow.html', {'page': page,
                                            'paginator': paginator})
 
 
 @login_required()
+@rate_limited('follow', methods=('GET', 'POST'))
 def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
@@ -147,9 +280,38 @@ def profile_follow(request, username):
 
 
 @login_required
+@rate_limited('follow', methods=('GET', 'POST'))
 def profile_unfollow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
     follows = user.follower.filter(author=author)
     follows.delete()
     return redirect('index')
+
+
+def follow_bulk_cost(request):
+    # токен за каждого автора; список длиннее предела отклоняется,
+    # но берёт не больше предела
+    return max(1, min(len(set(request.POST.getlist('author'))),
+                      settings.FOLLOW_BULK_MAX_AUTHORS))
+
+
+@login_required
+@require_POST
+@rate_limited('follow', cost=follow_bulk_cost)
+def follow_bulk(request):
+    """Follows or unfollows all authors listed in the request at once,
+    up to FOLLOW_BULK_MAX_AUTHORS of them"""
+    user = request.user
+    names = set(request.POST.getlist('author'))
+    if len(names) > settings.FOLLOW_BULK_MAX_AUTHORS:
+        return HttpResponseBadRequest(
+            f'Не больше {settings.FOLLOW_BULK_MAX_AUTHORS} авторов за раз')
+    authors = User.objects.filter(username__in=names).values_list(
+        'id', flat=True)
+    edges = [(user.id, author_id) for author_id in authors]
+    if request.POST.get('action') == 'unfollow':
+        unfollow_many(edges)
+    else:
+        follow_many(edges)
+    return redirect('follow_index')
@@ -0,0 +1,105 @@
+"""Flat pages served from a process-local index
+
+All flat pages of the site are loaded by URL with one query, rendered
+pages are kept in the cache with their ETag, which only anonymous
+visitors get: the fragments of signed in users change on their own.
+Saving a page bumps the version: the process reloads its index and
+renders the pages again on the next request. The version expires after
+FLATPAGES_TIMEOUT, so other processes with caches of their own pick up
+the change by then.
+"""
+import copy
+import hashlib
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.flatpages.views import render_flatpage
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponsePermanentRedirect
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.csrf import csrf_protect
+
+from posts.page_cache import fill
+
+VERSION_KEY = 'flatpages:version'
+
+_lock = Lock()
+# (версия, {url: FlatPage})
+_index = (None, {})
+
+
+def version():
+    # после вытеснения ключа версия начинается с нового значения,
+    # а не с уже использованной единицы
+    return cache.get_or_set(VERSION_KEY, time.time_ns,
+                            settings.FLATPAGES_TIMEOUT)
+
+
+def pages():
+    """Flat pages of the site by URL, reloaded with every new version"""
+    global _index
+    current = version()
+    if _index[0] != current:
+        with _lock:
+            if _index[0] != current:
+                site_pages = FlatPage.objects.filter(sites=settings.SITE_ID)
+                _index = current, {page.url: page for page in site_pages}
+    return _index[1]
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), settings.FLATPAGES_TIMEOUT)
+
+
+def flatpage(request, url):
+    """View function for flat pages, replaces the one of flatpages"""
+    if not url.startswith('/'):
+        url = '/' + url
+    index = pages()
+    page = index.get(url)
+    if page is None:
+        if (not url.endswith('/') and settings.APPEND_SLASH
+                and url + '/' in index):
+            return HttpResponsePermanentRedirect('%s/' % request.path)
+        raise Http404('Страница не найдена')
+    return render_page(request, page)
+
+
+def rendered(request, page):
+    """Shared rendering of a page with holes and its digest"""
+    key = f'flatpages:{version()}:{page.pk}'
+    result = cache.get(key)
+    if result is None:
+        request.punch_holes = True
+        try:
+            html = render_flatpage(request, copy.copy(page)).content.decode()
+        finally:
+            request.punch_holes = False
+        result = html, hashlib.md5(html.encode()).hexdigest()
+        cache.set(key, result, settings.FLATPAGES_TIMEOUT)
+    return result
+
+
+@csrf_protect
+def render_page(request, page):
+    if page.registration_required and not request.user.is_authenticated:
+        return redirect_to_login(request.path)
+    html, digest = rendered(request, page)
+    if request.user.is_authenticated:
+        # дыры страницы заполняются разметкой пользователя, которая
+        # меняется без правки страницы, поэтому ETag ей не положен
+        response = HttpResponse(fill(request, html))
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    etag = f'"{digest}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(fill(request, html))
+    response['ETag'] = etag
+    return response
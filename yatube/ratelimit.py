@@ -0,0 +1,136 @@
+"""Token bucket rate limits of write views
+
+A client has a bucket of burst tokens for every limited view, refilled
+at rate tokens a second. A request takes a token, or one per item for
+views acting on many items at once; when the bucket is short of tokens
+it is answered with 429 Too Many Requests before the view touches
+the database. Signed in users are limited by account and by address,
+anonymous clients by address. RATE_LIMITS sets the limits of a view for
+both kinds of buckets, the address one is looser: many users may share
+an address behind NAT.
+
+Buckets are kept in the default cache with one get_many and one
+set_many per request. With the local memory cache every process has
+buckets of its own, so a client spread over N worker processes gets N
+times the limit; a cache shared by the processes is needed for exact
+limits. Reads and writes are not atomic, a burst split between
+processes may get a few extra tokens even then. When the cache fails
+buckets are kept in the memory of the process instead.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+logger = logging.getLogger(__name__)
+
+# сколько корзин держать в памяти процесса, пока кэш недоступен
+LOCAL_MAX_KEYS = 10000
+
+
+class LocalBuckets:
+    """Cache-like store of buckets in the memory of the process, the
+    least recently used buckets are dropped first"""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        with self._lock:
+            return {key: self._buckets[key] for key in keys
+                    if key in self._buckets}
+
+    def set_many(self, buckets, timeout=None):
+        with self._lock:
+            for key, bucket in buckets.items():
+                self._buckets[key] = bucket
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+
+local_buckets = LocalBuckets(LOCAL_MAX_KEYS)
+
+
+def bucket_limits(request, name, limits):
+    """Maps the bucket keys of the request to their (rate, burst) pairs
+    from the limits of the view"""
+    keys = {f'ratelimit:{name}:ip:{request.META.get("REMOTE_ADDR")}':
+            limits['ip']}
+    if request.user.is_authenticated:
+        keys[f'ratelimit:{name}:user:{request.user.pk}'] = limits['user']
+    return keys
+
+
+def take(buckets, limits, now, cost=1):
+    """Refills the buckets of the keys of limits, a mapping to (rate,
+    burst) pairs, and takes cost tokens from every one of them. Returns
+    the new buckets, (tokens, time) pairs, and the seconds to wait for
+    the tokens, zero when the request is allowed"""
+    refilled = {}
+    wait = 0
+    for key, (rate, burst) in limits.items():
+        tokens, stamp = buckets.get(key, (burst, now))
+        refilled[key] = min(burst, tokens + (now - stamp) * rate)
+        wait = max(wait, (cost - refilled[key]) / rate)
+    if wait > 0:
+        return {}, wait
+    return {key: (tokens - cost, now)
+            for key, tokens in refilled.items()}, 0
+
+
+def check(request, name, limits, cost=1):
+    """Takes cost tokens for the request, returns the seconds to wait
+    before the next request when there are not enough"""
+    limits = bucket_limits(request, name, limits)
+    keys = list(limits)
+    now = time.time()
+    try:
+        store = cache
+        buckets = cache.get_many(keys)
+    except Exception:
+        logger.warning('Rate limit buckets are kept in memory, '
+                       'the cache is unavailable', exc_info=True)
+        store = local_buckets
+        buckets = store.get_many(keys)
+    buckets, wait = take(buckets, limits, now, cost)
+    if buckets:
+        # пустая корзина наполняется за burst / rate секунд,
+        # после этого ключ можно забыть
+        timeout = math.ceil(max(burst / rate
+                                for rate, burst in limits.values()))
+        try:
+            store.set_many(buckets, timeout)
+        except Exception:
+            local_buckets.set_many(buckets, timeout)
+    return wait
+
+
+def rate_limited(name, methods=('POST',), cost=None):
+    """Limits requests to a view with RATE_LIMITS[name], (tokens a
+    second, bucket size) pairs for the 'user' and 'ip' buckets, only
+    requests with the methods take tokens. cost is a function of the
+    request returning the number of tokens it takes, one by default"""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            limit = settings.RATE_LIMITS.get(name)
+            if limit is not None and request.method in methods:
+                wait = check(request, name, limit,
+                             1 if cost is None else cost(request))
+                if wait:
+                    response = render(request, 'misc/429.html', status=429)
+                    response['Retry-After'] = str(math.ceil(wait))
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
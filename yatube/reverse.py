@@ -0,0 +1,33 @@
+"""Memoized URL reversing for hot templates
+
+reverse() walks the resolver, matches the pattern and quotes every
+argument on each call. cached_reverse() remembers the result for the
+current resolver and script prefix: a reloaded URLconf gets a new
+resolver from get_resolver(), so stale URLs are never returned.
+"""
+from functools import lru_cache
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import get_resolver, get_script_prefix, get_urlconf, reverse
+
+# примерно по пять адресов на каждую карточку в лентах
+MAX_URLS = 50000
+
+
+@lru_cache(maxsize=MAX_URLS)
+def _reverse(resolver, prefix, viewname, args):
+    return reverse(viewname, args=args)
+
+
+def cached_reverse(viewname, *args):
+    """reverse(viewname, args=args) for hashable positional arguments"""
+    return _reverse(get_resolver(get_urlconf()), get_script_prefix(),
+                    viewname, args)
+
+
+@receiver(setting_changed)
+def urlconf_changed(setting, **kwargs):
+    # старые записи и так не найдутся, но держат в памяти резолверы
+    if setting in ('ROOT_URLCONF', 'FORCE_SCRIPT_NAME'):
+        _reverse.cache_clear()
@@ -0,0 +1,172 @@
+"""Serving of static and uploaded media files by the application itself"""
+import hashlib
+import mimetypes
+import os
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# имена вида bootstrap.min.0123456789ab.css создаёт ManifestStaticFilesStorage
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def file_path(root, path):
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    if not os.path.isfile(full_path):
+        raise Http404('Файл не найден')
+    return full_path
+
+
+def parse_accept_encoding(header):
+    """Maps the codings of an Accept-Encoding header to their q-values"""
+    qualities = {}
+    for item in header.split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def accepted_copy(request, full_path):
+    """Picks a precompressed copy of the file the client accepts,
+    the one with the highest q-value first"""
+    qualities = parse_accept_encoding(
+        request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    # "*" задаёт q для всех не названных кодировок, q=0 их запрещает
+    default = qualities.get('*', 0.0)
+    ranked = sorted(ENCODINGS,
+                    key=lambda item: -qualities.get(item[0], default))
+    for encoding, suffix in ranked:
+        if (qualities.get(encoding, default) > 0
+                and os.path.isfile(full_path + suffix)):
+            return full_path + suffix, encoding
+    return full_path, None
+
+
+def serve_static(request, path):
+    """Serves a collected static file, hashed names are cached forever"""
+    full_path = file_path(settings.STATIC_ROOT, path)
+    sent_path, encoding = accepted_copy(request, full_path)
+    stat = os.stat(sent_path)
+    etag = '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type = mimetypes.guess_type(full_path)[0]
+        # FileResponse отдаёт файл через wsgi.file_wrapper (sendfile)
+        response = FileResponse(
+            open(sent_path, 'rb'),
+            content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = (
+        IMMUTABLE if HASHED_NAME.search(path)
+        else f'public, max-age={settings.STATIC_MAX_AGE}')
+    return response
+
+
+@lru_cache(maxsize=4096)
+def content_hash(path, mtime, size):
+    """Digest of the file, recomputed only when it is modified"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_range(header, size):
+    """Returns (first, last) byte positions of a single range request,
+    None when there is no usable range and False when it is
+    not satisfiable"""
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # суффикс: последние N байт
+        first, last = max(size - int(last), 0), size - 1
+    else:
+        first = int(first)
+        last = min(int(last), size - 1) if last else size - 1
+    if first > last or first >= size:
+        return False
+    return first, last
+
+
+def read_range(path, first, last):
+    with open(path, 'rb') as source:
+        source.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = source.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+def range_response(request, full_path, size, etag):
+    """Full, partial or 416 response depending on the Range header"""
+    content_type = (mimetypes.guess_type(full_path)[0]
+                    or 'application/octet-stream')
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if 'HTTP_RANGE' in request.META and if_range in (None, etag):
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+    if byte_range is None:
+        return FileResponse(open(full_path, 'rb'), content_type=content_type)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    first, last = byte_range
+    response = StreamingHttpResponse(read_range(full_path, first, last),
+                                     status=206, content_type=content_type)
+    response['Content-Length'] = last - first + 1
+    response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    return response
+
+
+def serve_media(request, path):
+    """Serves an uploaded file or thumbnail with range and conditional
+    request support, the ETag is a digest of the file content"""
+    full_path = file_path(settings.MEDIA_ROOT, path)
+    stat = os.stat(full_path)
+    etag = '"%s"' % content_hash(full_path, stat.st_mtime_ns, stat.st_size)
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=int(stat.st_mtime))
+    if response is None:
+        response = range_response(request, full_path, stat.st_size, etag)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = f'public, max-age={settings.MEDIA_MAX_AGE}'
+    return response
@@ -11,21 +11,31 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
-from .keys import keys
+from importlib.util import find_spec
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
+def secret(name, env, convert=None):
+    """Value from the environment, keys.py is imported only without it"""
+    if env in os.environ:
+        value = os.environ[env]
+        return convert(value) if convert else value
+    from .keys import keys
+    return keys[name]
+
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = keys['SECRET_KEY']
+SECRET_KEY = secret('SECRET_KEY', 'YATUBE_SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('YATUBE_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = keys['HOSTS']
+ALLOWED_HOSTS = secret('HOSTS', 'YATUBE_HOSTS',
+                       lambda hosts: hosts.split(','))
 
 INTERNAL_IPS = [
     "127.0.0.1",
@@ -36,6 +46,7 @@ INTERNAL_IPS = [
 INSTALLED_APPS = [
     'users',
     'posts',
+    'jobs',
     'django.contrib.sites',
     'django.contrib.flatpages',
     'django.contrib.admin',
@@ -45,7 +56,6 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'sorl.thumbnail',
-    "debug_toolbar",
 ]
 
 MIDDLEWARE = [
@@ -56,19 +66,57 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
 
+# панель отладки только при разработке: она тянет за собой django.test,
+# а воркерам, командам и продакшену не нужна
+DEBUG_TOOLBAR = (DEBUG and find_spec('debug_toolbar') is not None
+                 and os.environ.get('YATUBE_DEBUG_TOOLBAR', '1') == '1')
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# предел холодного старта процесса в секундах: python -m benchmarks.startup
+# завершается с кодом 1, если его превышает; замер около 0.45 с
+STARTUP_BUDGET = 0.8
+
+# замер времени рендера шаблонов: таблица в логе и заголовок Server-Timing
+TEMPLATE_PROFILE = os.environ.get('YATUBE_TEMPLATE_PROFILE') == '1'
+if TEMPLATE_PROFILE:
+    MIDDLEWARE.append('yatube.template_profile.TemplateProfileMiddleware')
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {'console': {'class': 'logging.StreamHandler'}},
+        'loggers': {
+            'yatube.template_profile': {
+                'handlers': ['console'],
+                'level': 'INFO',
+            },
+        },
+    }
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
+_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+# без отладки шаблоны разбираются один раз на процесс, а не на каждый
+# рендер и каждый include
+if not DEBUG:
+    _LOADERS = [
+        ('django.template.loaders.cached.Loader', _LOADERS),
+    ]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': _LOADERS,
             'context_processors': [
                 'posts.context_processors.year',
                 'django.template.context_processors.debug',
@@ -90,6 +138,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # воркеры очереди пишут в ту же базу, ждём блокировку, а не падаем
+        'OPTIONS': {'timeout': 20},
     }
 }
 
@@ -133,24 +183,160 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
+# в продакшене статику с хэшами в именах и сжатыми копиями
+# отдаёт само приложение
+SERVE_STATIC = not DEBUG
+# время кэширования файлов без хэша в имени, с хэшем — год
+STATIC_MAX_AGE = 60 * 60
+if not DEBUG:
+    STATICFILES_STORAGE = 'yatube.storage.CompressedManifestStaticFilesStorage'
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# в продакшене загруженные картинки и миниатюры тоже отдаёт приложение
+SERVE_MEDIA = not DEBUG
+MEDIA_MAX_AGE = 30 * 24 * 60 * 60
+
+# Comments
+
+# количество комментариев на одной странице ленты комментариев
+COMMENTS_PER_PAGE = 20
+# показывать под постом только счётчик, а комментарии подгружать по запросу
+COMMENTS_LAZY_LOAD = False
+
+# Archive
+
+# посты старше этого числа дней команда archive_posts переносит в архив
+ARCHIVE_AFTER_DAYS = 90
+# через сколько секунд пересчитываются счётчики архива, чтобы процесс
+# увидел посты, перенесённые командой в другом процессе
+ARCHIVE_COUNT_TIMEOUT = 60
+
+# Soft delete
+
+# удалённые посты и комментарии можно восстановить столько дней,
+# потом команда purge_deleted удаляет их окончательно
+SOFT_DELETE_GRACE_DAYS = 30
+
+# Rate limits
+
+# токенов в секунду и размер корзины для вьюх с yatube.ratelimit: для
+# пользователя и, свободнее, для адреса, за которым может быть NAT.
+# Вьюха без записи здесь не ограничивается. Кэш в памяти у каждого
+# процесса свой, с N процессами лимит фактически в N раз выше
+RATE_LIMITS = {
+    'new_post': {'user': (1 / 30, 5), 'ip': (1 / 5, 30)},
+    'add_comment': {'user': (1 / 5, 10), 'ip': (1, 50)},
+    'follow': {'user': (1, 30), 'ip': (5, 150)},
+}
+
+# сколько авторов принимает follow_bulk за раз: каждый берёт токен из
+# корзины 'follow', список длиннее её размера не прошёл бы никогда
+FOLLOW_BULK_MAX_AUTHORS = 30
+
+# Page cache
+
+# общие для всех зрителей страницы лент, профиля и поста живут до
+# изменения контента, но не дольше этого времени
+PAGE_CACHE_TIMEOUT = 5 * 60
+
+# Post cards
+
+# True собирает карточки постов в лентах в Python, а не шаблоном
+# includes/post_card.html; разметка одна и та же, но правки шаблона
+# тогда нужно повторять в posts/templatetags/post_cards.py
+FAST_POST_CARDS = False
+
+# Follow graph
+
+# сколько пользователей держать в кэше графа подписок одного процесса
+FOLLOW_GRAPH_MAX_USERS = 10000
+# через сколько секунд процесс перечитывает подписки пользователя, чтобы
+# увидеть изменения, сделанные другими процессами
+FOLLOW_GRAPH_TTL = 60
+
+# Flat pages
+
+# через сколько секунд индекс и отрисованные flat pages загружаются
+# заново, чтобы процесс увидел правки, сделанные в других процессах
+FLATPAGES_TIMEOUT = 5 * 60
+
+# Group stats
+
+# через сколько секунд статистика и первые страницы групп считаются
+# заново, чтобы процесс увидел изменения других процессов
+GROUP_STATS_TIMEOUT = 60
+
+# Trending
+
+# за это время (в секундах) вес события в рейтинге падает вдвое
+TRENDING_HALF_LIFE = 12 * 60 * 60
+# сколько лучших постов хранить в кэше для ленты и для каждой группы
+TRENDING_TOP_K = 100
+# через сколько секунд списки перестраиваются из базы, чтобы процесс
+# увидел события, записанные другими процессами
+TRENDING_TOP_TIMEOUT = 60
+TRENDING_COMMENT_WEIGHT = 1
+TRENDING_FOLLOWER_WEIGHT = 0.5
+
+# Background jobs
+
+# воркеры по умолчанию для manage.py run_workers
+JOBS_PROCESSES = 1
+JOBS_THREADS = 2
+# пауза опроса пустой очереди, в секундах
+JOBS_POLL_INTERVAL = 1
+JOBS_MAX_ATTEMPTS = 5
+# задержка первого повтора, дальше она удваивается до максимума
+JOBS_RETRY_DELAY = 10
+JOBS_RETRY_MAX_DELAY = 60 * 60
+# через сколько секунд задачу упавшего воркера можно взять снова
+JOBS_LEASE = 5 * 60
+
 # Login
 
 LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index"
 # LOGOUT_REDIRECT_URL = "index"
 
-#  подключаем движок filebased.EmailBackend
-EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
+# письма из запросов только ставятся в очередь,
+# отправляет их задача flush_mail фоновых воркеров
+EMAIL_BACKEND = 'jobs.mail.QueuedEmailBackend'
+#  воркеры отправляют письма через filebased.EmailBackend,
+#  в бою здесь будет smtp.EmailBackend
+MAIL_DELIVERY_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
+# писем за один захват очереди, все уходят через одно соединение
+MAIL_BATCH_SIZE = 100
+MAIL_MAX_ATTEMPTS = 5
+# отправка откладывается на секунды, чтобы письма соседних
+# запросов ушли одной пачкой
+MAIL_FLUSH_DELAY = 1
+# письма подписчикам о новых записях автора
+NOTIFY_FOLLOWERS = True
 # Идентификатор текущего сайта
 SITE_ID = 1
+# схема ссылок на сайт в письмах, домен берётся из Site
+SITE_SCHEME = 'http' if DEBUG else 'https'
+
+# сессии хранятся только в базе: кэш у каждого процесса свой, и выход из
+# аккаунта очистил бы сессию лишь в одном из них. cached_db годится
+# только с общим для всех процессов кэшем
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+# схема тестовой базы без миграций, быстрый хэшер паролей, медиа в памяти
+TEST_RUNNER = 'yatube.testing.TestRunner'
 
+# у каждого процесса свой кэш в памяти. Процесс сразу видит свои изменения,
+# а изменения других процессов, воркеров и команд — когда истекут сроки
+# *_TIMEOUT и *_TTL выше. Чтобы процессы видели их сразу, нужен общий кэш
+# (memcached, redis)
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # страницы и счётчики не влезают в 300 записей по умолчанию
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
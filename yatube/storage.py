@@ -0,0 +1,88 @@
+"""Storages of the project"""
+import gzip
+import hashlib
+import os
+import tempfile
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.ico', '.txt', '.json',
+                '.xml', '.html', '.eot', '.ttf', '.otf')
+# меньшие файлы сжатие только увеличивает
+MIN_SIZE = 256
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes gzip and, when the brotli
+    package is installed, brotli copies of text files at collectstatic"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()) | set(paths):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as source:
+            data = source.read()
+        if len(data) < MIN_SIZE:
+            return
+        copies = {'.gz': gzip.compress(data, 9)}
+        if brotli is not None:
+            copies['.br'] = brotli.compress(data)
+        for suffix, compressed in copies.items():
+            if len(compressed) >= len(data):
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Keeps every upload once under the digest of its content, like
+    posts/3f/3f2a...e1.jpg, so reposted images share one file and one
+    set of thumbnails. Blobs are removed by posts.media.release when no
+    post refers to them anymore"""
+
+    def get_available_name(self, name, max_length=None):
+        # одинаковое имя значит одинаковое содержимое
+        return name
+
+    def _save(self, name, content):
+        directory, extension = os.path.dirname(name), os.path.splitext(name)[1]
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        handle, temp_path = tempfile.mkstemp(dir=self.location,
+                                             suffix='.upload')
+        try:
+            with os.fdopen(handle, 'wb') as temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            key = digest.hexdigest()
+            name = os.path.join(directory, key[:2],
+                                key + extension.lower()).replace('\\', '/')
+            full_path = self.path(name)
+            if not os.path.exists(full_path):
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.replace(temp_path, full_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+
+media_storage = ContentAddressedStorage()
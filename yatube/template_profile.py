@@ -0,0 +1,105 @@
+"""Render time profiling of templates
+
+Every render of a template, {% include %} ones too, is accounted by
+template name: number of renders, total time with the nested templates
+and own time without them. Collection is switched on per thread with
+profile(), TemplateProfileMiddleware profiles every request.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_original = None
+
+
+class TemplateStats:
+    def __init__(self):
+        # template name -> [renders, total seconds, own seconds]
+        self.rows = {}
+
+    def add(self, name, total, own):
+        row = self.rows.setdefault(name, [0, 0.0, 0.0])
+        row[0] += 1
+        row[1] += total
+        row[2] += own
+
+    def top(self, limit=None):
+        """Rows sorted by own time, the heaviest templates first"""
+        rows = sorted(self.rows.items(), key=lambda item: -item[1][2])
+        return rows[:limit]
+
+    def report(self, limit=None):
+        lines = [f'{"template":<36} {"calls":>6} {"total ms":>10} '
+                 f'{"own ms":>10}']
+        for name, (calls, total, own) in self.top(limit):
+            lines.append(f'{name:<36} {calls:>6} {total * 1000:>10.2f} '
+                         f'{own * 1000:>10.2f}')
+        return '\n'.join(lines)
+
+
+def _profiled(self, context):
+    profiles = getattr(_local, 'profiles', None)
+    if not profiles:
+        return _original(self, context)
+    # время вложенных шаблонов копится у родителя на вершине стека
+    _local.stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original(self, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = _local.stack.pop()
+        if _local.stack:
+            _local.stack[-1] += elapsed
+        name = self.origin.template_name or self.origin.name
+        for stats in profiles:
+            stats.add(str(name), elapsed, elapsed - nested)
+
+
+def install():
+    global _original
+    # _render подменяют debug_toolbar и тестовое окружение, поэтому
+    # оборачивается публичный render
+    if _original is None:
+        _original = Template.render
+        Template.render = _profiled
+
+
+@contextmanager
+def profile():
+    """Collects render times of templates rendered in this thread"""
+    install()
+    if not hasattr(_local, 'profiles'):
+        _local.profiles, _local.stack = [], []
+    stats = TemplateStats()
+    _local.profiles.append(stats)
+    try:
+        yield stats
+    finally:
+        _local.profiles.remove(stats)
+
+
+class TemplateProfileMiddleware:
+    """Logs template render times of every request and reports the
+    heaviest templates in the Server-Timing header"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        with profile() as stats:
+            response = self.get_response(request)
+        if stats.rows:
+            response['Server-Timing'] = ', '.join(
+                f'tpl{index};desc="{name}";dur={own * 1000:.2f}'
+                for index, (name, (calls, total, own))
+                in enumerate(stats.top(5)))
+            logger.info('Templates of %s\n%s', request.path, stats.report())
+        return response
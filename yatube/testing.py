@@ -0,0 +1,58 @@
+"""Settings and runner for fast test runs
+
+Tests build the schema straight from the models instead of replaying
+every migration, hash passwords with MD5 and keep uploaded files in a
+temporary directory, in memory when /dev/shm is available. The same
+overrides are used by manage.py test and by pytest through conftest.py.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class DisableMigrations:
+    """MIGRATION_MODULES value which makes migrate create tables with
+    syncdb for every app"""
+
+    def __contains__(self, app_label):
+        return True
+
+    def __getitem__(self, app_label):
+        return None
+
+
+def media_root():
+    shm = '/dev/shm'
+    path = tempfile.mkdtemp(prefix='yatube-media-',
+                            dir=shm if os.access(shm, os.W_OK) else None)
+    atexit.register(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+def test_settings():
+    return override_settings(
+        MIGRATION_MODULES=DisableMigrations(),
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+        MEDIA_ROOT=media_root(),
+    )
+
+
+class TestRunner(DiscoverRunner):
+    """Test runner applying test_settings for the whole run.
+
+    With --parallel workers are forked from the process which already
+    has the test database, so every worker starts from its copy.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = test_settings()
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,10 +1,13 @@
+import re
+
 from django.contrib import admin
-from django.urls import include, path
-from django.contrib.flatpages import views
+from django.urls import include, path, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.conf.urls import handler404, handler500
 
+from . import flatpages
+
 handler404 = "posts.views.page_not_found" # noqa
 handler500 = "posts.views.server_error" # noqa
 
@@ -13,7 +16,8 @@ urlpatterns = [
     path("auth/", include("users.urls")),
 
     # flatpages
-    path('about/', include('django.contrib.flatpages.urls')),
+    path('about/<path:url>', flatpages.flatpage,
+         name='django.contrib.flatpages.views.flatpage'),
 
     #  если нужного шаблона для /auth не нашлось в файле users.urls —
     #  ищем совпадения в файле django.contrib.auth.urls
@@ -27,15 +31,31 @@ urlpatterns = [
 ]
 
 urlpatterns += [
-        path('about-us/', views.flatpage, {'url': '/about-us/'}, name='about'),
-        path('terms/', views.flatpage, {'url': '/terms/'}, name='terms'),
-        path('about-author/', views.flatpage, {'url': '/about-author/'}, name='about-author'), # noqa
-        path('about-spec/', views.flatpage, {'url': '/about-spec/'}, name='about-spec'), # noqa
+        path('about-us/', flatpages.flatpage, {'url': '/about-us/'}, name='about'),  # noqa
+        path('terms/', flatpages.flatpage, {'url': '/terms/'}, name='terms'),  # noqa
+        path('about-author/', flatpages.flatpage, {'url': '/about-author/'}, name='about-author'), # noqa
+        path('about-spec/', flatpages.flatpage, {'url': '/about-spec/'}, name='about-spec'), # noqa
 ]
 
-if settings.DEBUG:
-    import debug_toolbar
+if settings.SERVE_STATIC:
+    from .serve import serve_static
+
+    static_prefix = re.escape(settings.STATIC_URL.lstrip('/'))
+    urlpatterns.insert(0, re_path(rf'^{static_prefix}(?P<path>.+)$',
+                                  serve_static))
+
+if settings.SERVE_MEDIA:
+    from .serve import serve_media
 
+    media_prefix = re.escape(settings.MEDIA_URL.lstrip('/'))
+    urlpatterns.insert(0, re_path(rf'^{media_prefix}(?P<path>.+)$',
+                                  serve_media))
+
+if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT) # noqa
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT) # noqa
+
+if settings.DEBUG_TOOLBAR:
+    import debug_toolbar
+
     urlpatterns += (path("__debug__/", include(debug_toolbar.urls)),)
@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# плоские страницы загружаются до первого запроса
+from django.db import DatabaseError  # noqa: E402
+from yatube.flatpages import pages  # noqa: E402
+
+try:
+    pages()
+except DatabaseError:
+    # база ещё не создана, индекс загрузится при первом запросе
+    pass